@@ -0,0 +1,279 @@
+"""Benchmarks of the synthesis and mixing code paths.
+
+Runs headless, without a sound device, and measures the cost of rendering a
+block of audio across block sizes, voice counts, waveform shapes and filter
+types. For each case it reports the time per block, the realtime factor
+(duration of the block divided by the time it took to render) and the peak
+memory allocated per block.
+
+Usage:
+    python benchmarks/run.py                    # Run all benchmarks.
+    python benchmarks/run.py -k filter --quick  # Run a subset, quickly.
+    python benchmarks/run.py --save base.json   # Save results as a baseline.
+    python benchmarks/run.py --compare base.json
+"""
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from synthoor import player
+from synthoor.config import FPS
+from synthoor.envelope import Envelope
+from synthoor.filters import ButterFilter
+from synthoor.oscillator import Oscillator, get_radians, get_square_wave
+from synthoor.sound import GatedSound
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZES = [64, 256, 1024, 8192]
+VOICE_COUNTS = [1, 16, 64, 256]
+SHAPES = ["sine", "tri", "saw", "square"]
+BTYPES = ["lowpass", "highpass", "bandpass"]
+
+
+class Voice(GatedSound):
+    """A simple subtractive voice used to benchmark the mixer."""
+
+    def __init__(self, shape="saw"):
+        super().__init__()
+
+        self.osc = Oscillator(shape)
+        self.env = Envelope(0.01, 0.1, 0.5, 0.2)
+        self.filter = ButterFilter(btype="lowpass")
+
+    def forward(self):
+        g0 = self.gate()
+        a0 = self.osc(freq=self.freq)
+        a1 = self.filter(a0, freq=4 * self.freq)
+
+        return a1 * self.env(g0)
+
+
+#
+# Each case returns a function that renders a single block of given size.
+#
+
+
+def case_radians(frames):
+    freq = 440.0
+    return lambda: get_radians(freq, 0, frames)
+
+
+def case_square_wave(frames):
+    freq = np.linspace(100, 2000, frames)
+    return lambda: get_square_wave(freq, 0, frames, duty=0.3)
+
+
+def case_oscillator(frames, shape):
+    osc = Oscillator(shape, freq=440)
+    return lambda: osc(frames=frames)
+
+
+def case_filter(frames, btype):
+    f0 = ButterFilter(freq=1000, btype=btype)
+    f0.warmup()
+
+    x = np.random.default_rng(0).uniform(-1, 1, (frames, 1))
+    km = np.linspace(0, 24, frames)[:, None]
+
+    return lambda: f0(x, key_modulation=km, frames=frames)
+
+
+def case_envelope(frames):
+    env = Envelope(0.01, 0.05, 0.5, 0.05, linear=False)
+
+    # A gate that toggles every 1/20th of a second.
+    gate = (np.arange(FPS) // (FPS // 20) % 2).astype("float64")[:, None]
+    offset = [0]
+
+    def fn():
+        i0 = offset[0] % (FPS - frames)
+        offset[0] += frames
+        return env(gate[i0 : i0 + frames], frames=frames)
+
+    return fn
+
+
+def case_mixer(frames, voices):
+    player.stop_sound()
+    player.set_clock(0.0)
+
+    for i in range(voices):
+        v = Voice()
+        v.filter.warmup()
+        v.play(note=36 + i % 48, duration=1e6)
+
+    out = np.zeros((frames, 2))
+
+    def fn():
+        player.set_clock(player.get_clock() + frames / FPS)
+        return player._render(out, frames)
+
+    return fn
+
+
+def get_cases(quick=False):
+    """Get list of (name, frames, factory) benchmark cases."""
+    sizes = [256, 8192] if quick else BLOCK_SIZES
+    counts = [1, 16] if quick else VOICE_COUNTS
+
+    for n in sizes:
+        yield "radians", n, case_radians
+        yield "square_wave", n, case_square_wave
+        yield "envelope", n, case_envelope
+
+        for shape in SHAPES:
+            yield "oscillator/%s" % shape, n, lambda n, s=shape: case_oscillator(n, s)
+
+        for btype in BTYPES:
+            yield "filter/%s" % btype, n, lambda n, b=btype: case_filter(n, b)
+
+        for v in counts:
+            yield "mixer/%d" % v, n, lambda n, v=v: case_mixer(n, v)
+
+
+def measure(fn, frames, min_time=0.2, min_blocks=5):
+    """Measure the time and peak memory allocated per block.
+
+    Returns:
+        dict: Benchmark results.
+    """
+    for _ in range(3):
+        fn()
+
+    blocks = 0
+    t0 = time.perf_counter()
+
+    while blocks < min_blocks or time.perf_counter() - t0 < min_time:
+        fn()
+        blocks += 1
+
+    dt = (time.perf_counter() - t0) / blocks
+
+    tracemalloc.start()
+    peak = 0
+
+    for _ in range(min_blocks):
+        tracemalloc.reset_peak()
+        t1, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, t2 = tracemalloc.get_traced_memory()
+        peak = max(peak, t2 - t1)
+
+    tracemalloc.stop()
+
+    return dict(
+        frames=frames,
+        blocks=blocks,
+        us_per_block=dt * 1e6,
+        realtime=frames / FPS / dt,
+        alloc_kb=peak / 1024,
+    )
+
+
+def run(pattern=None, quick=False, min_time=0.2):
+    player.disable_audio()
+
+    results = {}
+
+    try:
+        for name, frames, factory in get_cases(quick):
+            key = "%s@%d" % (name, frames)
+
+            if pattern and pattern not in key:
+                continue
+
+            results[key] = r = measure(factory(frames), frames, min_time)
+
+            print(
+                "%-28s %10.1f us %10.1fx realtime %10.1f KiB"
+                % (key, r["us_per_block"], r["realtime"], r["alloc_kb"])
+            )
+    finally:
+        player.stop_sound()
+        player.set_clock(None)
+
+    return results
+
+
+def compare(results, baseline, threshold=0.1):
+    """Print changes in time per block relative to the baseline.
+
+    Returns:
+        list: Keys of cases that are slower than the baseline by more than
+            the threshold.
+    """
+    regressions = []
+
+    print()
+    print("%-28s %12s %12s %8s" % ("case", "baseline us", "current us", "change"))
+
+    for key, r in results.items():
+        b = baseline.get(key)
+        if b is None:
+            continue
+
+        change = r["us_per_block"] / b["us_per_block"] - 1
+        flag = ""
+
+        if change > threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+
+        print(
+            "%-28s %12.1f %12.1f %+7.1f%%%s"
+            % (key, b["us_per_block"], r["us_per_block"], change * 100, flag)
+        )
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-k", dest="pattern", help="only run matching cases")
+    parser.add_argument("--quick", action="store_true", help="reduced grid")
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--save", metavar="PATH", help="save results as JSON")
+    parser.add_argument("--compare", metavar="PATH", help="compare to baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative slowdown reported as a regression",
+    )
+
+    args = parser.parse_args(argv)
+
+    results = run(args.pattern, args.quick, args.min_time)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                dict(
+                    python=platform.python_version(),
+                    numpy=np.__version__,
+                    results=results,
+                ),
+                f,
+                indent=2,
+            )
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+        if compare(results, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
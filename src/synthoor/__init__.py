@@ -1,4 +1,34 @@
 from .sound import Sound, GatedSound, LatencyGate
 from .oscillator import Oscillator
 from .envelope import Envelope
-from .filters import ButterFilter
+from .offline import OfflineRenderer
+from .sequencer import Sequencer
+from .voices import VoiceManager
+from .rendercache import RenderCache
+from .profiler import Profiler
+
+__all__ = [
+    "Sound",
+    "GatedSound",
+    "LatencyGate",
+    "Oscillator",
+    "Envelope",
+    "ButterFilter",
+    "FilterBank",
+    "OfflineRenderer",
+    "Sequencer",
+    "VoiceManager",
+    "RenderCache",
+    "Profiler",
+]
+
+
+def __getattr__(name):
+    # Filters depend on scipy, which is slow to import, so they are only
+    # imported when first used.
+    if name in ("ButterFilter", "FilterBank"):
+        from . import filters
+
+        return getattr(filters, name)
+
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,238 @@
+import collections
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+from .config import FPS
+from .recorder import StreamWriter
+
+logger = logging.getLogger(__name__)
+
+
+#
+# The timestamps passed to the stream callback, with the same fields as the
+# time argument of a sounddevice callback.
+#
+StreamTime = collections.namedtuple(
+    "StreamTime", ["inputBufferAdcTime", "outputBufferDacTime", "currentTime"]
+)
+
+
+class Backend(object):
+    """An audio output that periodically calls the player stream callback
+    with a buffer to render into.
+
+    The callback has the signature of a sounddevice stream callback,
+    ``callback(outdata, frames, time, status)``.
+    """
+
+    def start(self, callback):
+        """Start calling given callback, from a thread of the backend."""
+        raise NotImplementedError
+
+    def stop(self):
+        """Stop calling the callback."""
+
+    def reset(self):
+        """Reopen the output, e.g. after the default device changed."""
+
+
+class SoundDeviceBackend(Backend):
+    """Play audio on a sound device with the sounddevice module, which is
+    only imported once the backend starts.
+
+    Args:
+        **params: Arguments of ``sounddevice.OutputStream``.
+    """
+
+    def __init__(self, **params):
+        self.params = params
+
+        self._sd = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._reset = False
+        self._stop = False
+
+    def start(self, callback):
+        import sounddevice
+
+        self._sd = sounddevice
+        self._stop = False
+
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(callback,),
+            name="synthoor-sounddevice",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _run(self, callback):
+        """Keep the output stream open until the backend stops."""
+        logger.info("Enter SoundDeviceBackend._run().")
+
+        sd = self._sd
+
+        while not self._stop:
+            if self._reset:
+                self._reset = False
+                sd._exit_handler()
+                sd._initialize()
+
+            with sd.OutputStream(
+                samplerate=FPS, channels=2, callback=callback, **self.params
+            ):
+                self._queue.get()
+
+    def set_params(self, **params):
+        """Reopen the output stream with given stream parameters."""
+        self.params.update(params)
+        self._queue.put(1)
+
+    def reset(self):
+        self._reset = True
+        self._queue.put(1)
+
+    def stop(self):
+        self._stop = True
+        self._queue.put(1)
+
+
+class NullBackend(Backend):
+    """Render audio on a background thread and discard it.
+
+    Sounds play with their usual timing, so they may still be recorded, or
+    monitored with metrics, on machines without a sound device.
+
+    Args:
+        frames (int): The number of frames in each block.
+        realtime (bool): Render blocks at the pace they would be played,
+            rather than as fast as possible.
+        latency (float): Seconds between rendering a block and the time its
+            first frame is considered played.
+    """
+
+    def __init__(self, frames=512, realtime=True, latency=0.0):
+        self.frames = frames
+        self.realtime = realtime
+        self.latency = latency
+
+        self._thread = None
+        self._stop = None
+
+    def start(self, callback):
+        self._stop = threading.Event()
+
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(callback, self._stop),
+            name="synthoor-%s" % type(self).__name__,
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def _run(self, callback, stop):
+        logger.info("Enter %s._run().", type(self).__name__)
+
+        frames = self.frames
+        outdata = np.zeros((frames, 2), "float32")
+
+        # The time at which the next block starts playing.
+        t1 = time.time() + self.latency
+
+        try:
+            while not stop.is_set():
+                t0 = time.time()
+
+                if self.realtime:
+                    if t1 - self.latency > t0:
+                        stop.wait(t1 - self.latency - t0)
+                        continue
+                else:
+                    t1 = t0 + self.latency
+
+                callback(outdata, frames, StreamTime(0.0, t1, t1 - self.latency), None)
+                self.write(outdata)
+
+                t1 += frames / FPS
+
+        except Exception as e:
+            logger.error(e)
+
+        finally:
+            self.close()
+
+    def write(self, a0):
+        """Consume the rendered block."""
+
+    def close(self):
+        """Release resources once the backend stops."""
+
+
+class FileBackend(NullBackend):
+    """Render audio on a background thread into a file or a pipe.
+
+    With a path, blocks are written as a 32 bit float WAV file. With a file
+    object, such as ``sys.stdout.buffer``, raw interleaved 32 bit float
+    frames are written to it, e.g. to be piped into another program.
+
+    Args:
+        target (str or file): Path of a WAV file, or a binary file object.
+        frames (int): The number of frames in each block.
+        realtime (bool): Render blocks at the pace they would be played.
+            Otherwise blocks are rendered as fast as they are written, which
+            is useful with a pipe, whose reader then sets the pace.
+        latency (float): Seconds between rendering a block and the time its
+            first frame is considered played.
+    """
+
+    def __init__(self, target, frames=512, realtime=True, latency=0.0):
+        super().__init__(frames, realtime, latency)
+
+        self.target = target
+
+        self._writer = None
+        self._file = None
+
+    def start(self, callback):
+        if isinstance(self.target, str):
+            self._writer = StreamWriter(self.target, 2, FPS)
+        else:
+            self._file = self.target
+
+        super().start(callback)
+
+    def write(self, a0):
+        if self._writer is not None:
+            self._writer.write(a0)
+        else:
+            self._file.write(a0.astype("float32", copy=False).tobytes())
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        elif self._file is not None:
+            self._file.flush()
+            self._file = None
+
+
+_backends = dict(
+    sounddevice=SoundDeviceBackend,
+    null=NullBackend,
+    file=FileBackend,
+)
+
+
+def get_backend_class(name):
+    """Get backend class by name - one of `sounddevice`, `null`, or `file`."""
+    return _backends[name]
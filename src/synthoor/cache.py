@@ -0,0 +1,93 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+#
+# Bump this version whenever the layout or content of cached arrays changes.
+#
+CACHE_VERSION = 1
+
+
+def get_cache_dir():
+    """Get the directory of the on-disk cache.
+
+    The directory may be set with the ``SYNTHOOR_CACHE_DIR`` environment
+    variable and defaults to ``~/.cache/synthoor``.
+    """
+    path = os.environ.get("SYNTHOOR_CACHE_DIR")
+
+    if not path:
+        path = os.path.join(os.path.expanduser("~"), ".cache", "synthoor")
+
+    return path
+
+
+def _get_path(name, key):
+    digest = hashlib.sha1(repr((CACHE_VERSION, key)).encode()).hexdigest()[:16]
+    dirname = "%s-v%s-%s" % (name, CACHE_VERSION, digest)
+
+    return os.path.join(get_cache_dir(), dirname)
+
+
+def load_arrays(name, key, mmap_mode="r"):
+    """Load a set of cached arrays, memory-mapped read only by default.
+
+    Args:
+        name (str): Name of the set of arrays.
+        key: A key with a stable ``repr()`` that identifies the content.
+        mmap_mode (str): The memory-map mode, e.g. `c` for copy-on-write
+            arrays, for functions that reject read-only arrays.
+
+    Returns:
+        dict: Mapping of array names to arrays, or None if not cached.
+    """
+    path = _get_path(name, key)
+
+    if not os.path.isdir(path):
+        return None
+
+    try:
+        return {
+            fn[:-4]: np.load(os.path.join(path, fn), mmap_mode=mmap_mode)
+            for fn in os.listdir(path)
+            if fn.endswith(".npy")
+        }
+
+    except (OSError, ValueError) as e:
+        logger.warning("Failed to load cached arrays from %r: %s", path, e)
+
+
+def save_arrays(name, key, arrays):
+    """Save a set of arrays to the on-disk cache.
+
+    The arrays are written to a temporary directory which is then renamed,
+    so concurrent processes never see a partially written set.
+
+    Args:
+        name (str): Name of the set of arrays.
+        key: A key with a stable ``repr()`` that identifies the content.
+        arrays (dict): Mapping of array names to arrays.
+    """
+    path = _get_path(name, key)
+
+    try:
+        os.makedirs(get_cache_dir(), exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=get_cache_dir())
+
+        for k, a0 in arrays.items():
+            np.save(os.path.join(tmp, k + ".npy"), a0)
+
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Another process got there first.
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    except OSError as e:
+        logger.warning("Failed to save cached arrays to %r: %s", path, e)
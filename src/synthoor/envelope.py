@@ -1,5 +1,6 @@
 import math
 import numpy as np
+from .player import get_dtype
 from .sound import Sound
 from .config import FPS, EPSILON
 
@@ -48,39 +49,69 @@ def get_linear_adsr_curve(dt, start=0, end=None):
 
 
 def gate2events(gate, v0=0, index=0):
-    states = []
+    """Extract open and close events from a gate signal.
 
-    end = index + len(gate)
-    gate = gate > 0
+    Args:
+        gate (ndarray): The gate signal.
+        v0 (int): The last value of the gate signal before this block.
+        index (int): The frame index of the first frame of the block.
 
-    while len(gate):
-        if v0 == 0:
-            am = int(gate.argmax())
-            gv = int(bool(gate[am]))
+    Returns:
+        tuple: List of (frame index, event) tuples ending with a "continue"
+            event at the end of the block, and the last gate value.
+    """
+    gate = np.ravel(gate) > 0
 
-            if gv == v0:
-                break
+    edges = np.flatnonzero(np.diff(gate, prepend=bool(v0)))
 
-            v0 = gv
-            index += am
-            states.append((index, "open"))
-            gate = gate[am:]
+    states = _edges2events(edges.tolist(), v0, index)
+    states.append((index + len(gate), "continue"))
 
-        else:
-            am = int(gate.argmin())
-            gv = int(bool(gate[am]))
+    if len(gate):
+        v0 = int(gate[-1])
 
-            if gv == v0:
-                break
+    return states, v0
 
-            v0 = gv
-            index += am
-            states.append((index, "close"))
-            gate = gate[am:]
 
-    states.append((end, "continue"))
+def gates2events(gates, v0, index):
+    """Extract open and close events from a batch of gate signals at once.
 
-    return states, v0
+    Args:
+        gates (ndarray): Array of shape (frames, ngates).
+        v0 (sequence): The last value of each gate signal before this block.
+        index (sequence): The frame index of the first frame of the block,
+            for each gate.
+
+    Returns:
+        tuple: List of event lists as returned by gate2events(), and list of
+            last gate values.
+    """
+    frames = len(gates)
+    gates = gates.reshape(frames, len(v0)) > 0
+
+    v0 = np.asarray(v0, dtype="bool")
+    d = np.diff(gates, axis=0, prepend=v0[None, :])
+
+    # Edges ordered by gate, then by frame.
+    gi, fi = np.nonzero(d.T)
+    splits = np.searchsorted(gi, np.arange(1, gates.shape[1]))
+
+    states = []
+
+    for i, edges in enumerate(np.split(fi, splits)):
+        sl = _edges2events(edges.tolist(), int(v0[i]), index[i])
+        sl.append((index[i] + frames, "continue"))
+        states.append(sl)
+
+    if frames:
+        v0 = gates[-1]
+
+    return states, v0.astype("int64").tolist()
+
+
+def _edges2events(edges, v0, index):
+    names = ("open", "close") if not v0 else ("close", "open")
+    return [(index + e, names[i % 2]) for i, e in enumerate(edges)]
 
 
 #
@@ -125,16 +156,73 @@ class Envelope(Sound):
         # Last gate value.
         self._lgate = 0
 
+    def reset(self, shared=False):
+        # Keep the start of the current state relative to the frame counter.
+        self._start -= self.index
+
+        super().reset(shared)
+
     def forward(self, gate):
         states, self._lgate = gate2events(gate, self._lgate, self.index)
-        index = self.index
+        segments = self.get_segments(states)
+
+        return render_segments(segments, self.frames, get_dtype())[:, None]
+
+    @classmethod
+    def forward_batch(cls, envelopes, gates):
+        """Compute the next block of a batch of envelopes, each with its own
+        state, as a single array computation.
+
+        Args:
+            envelopes (list): Envelope objects.
+            gates (ndarray): Array of shape (frames, nenvelopes) with the gate
+                signal of each envelope.
+
+        Returns:
+            ndarray: Array of shape (frames, nenvelopes), or NotImplemented
+                if the envelopes can not be computed together.
+        """
+        if cls.forward is not Envelope.forward or any(e.krate for e in envelopes):
+            return NotImplemented
+
+        frames = len(gates)
+        segments = []
+
+        states, lgates = gates2events(
+            gates, [e._lgate for e in envelopes], [e.index for e in envelopes]
+        )
+
+        for i, e in enumerate(envelopes):
+            e._lgate = lgates[i]
+
+            for segment in e.get_segments(states[i]):
+                segments.append((segment[0] + i * frames,) + segment[1:])
+
+        a0 = render_segments(segments, frames * len(envelopes), get_dtype())
+        a0 = a0.reshape(len(envelopes), frames).T
+
+        for i, e in enumerate(envelopes):
+            e.frames = frames
+            e.index += frames
+            e._a0 = a0[:, i : i + 1]
 
-        curves = []
+        return a0
+
+    def get_segments(self, states):
+        """Compute the piecewise curve segments of the next block.
+
+        Args:
+            states (list): Gate events as returned by gate2events().
+
+        Returns:
+            list: Segments as accepted by render_segments().
+        """
+        index = self.index
+        segments = []
 
         for event_index, event in states:
             while index < event_index:
-                curves.append(self.get_curve(index, event_index))
-                index += len(curves[-1])
+                index += self.get_segment(index, event_index, segments)
 
             if event == "open" and self._state != "attack":
                 self._state = "attack"
@@ -146,27 +234,25 @@ class Envelope(Sound):
                 self._start = index
                 self._valu0 = self._valu1
 
-        return np.concatenate(curves)[:, None]
+        return segments
 
-    def get_curve(self, start, end):
-        end = max(start, end)
+    def get_segment(self, start, end, segments):
+        """Append the segment of the current state starting at frame *start*
+        and ending at frame *end* or at the end of the state, whichever comes
+        first, and advance the state.
 
-        if self._state in (None, "sustain"):
-            return np.ones((end - start,), dtype="float64") * self._valu0
-
-        start = start - self._start
-        end = end - self._start
-        dt = getattr(self, self._state)
-
-        if self.linear:
-            curve = get_linear_adsr_curve(dt, start, end)
-        else:
-            curve = get_exponential_adsr_curve(dt, start, end)
+        Returns:
+            int: The length of the segment.
+        """
+        offset = start - self.index
 
-        if len(curve) == 0:
-            return curve
+        if self._state in (None, "sustain"):
+            segments.append((offset, end - start, 0, 1, self._valu0, self._valu0, True))
+            return end - start
 
-        done = curve[-1] >= 1 - EPSILON
+        j0 = start - self._start
+        df = max(math.ceil(getattr(self, self._state) * FPS / (self.krate or 1)), 1)
+        n = max(0, min(df - j0, end - start))
 
         if self._state == "attack":
             target = 1.0
@@ -184,13 +270,86 @@ class Envelope(Sound):
             target = 0.0
             next_state = None
 
-        curve = (target - self._valu0) * curve + self._valu0
+        if n:
+            segments.append((offset, n, j0, df, self._valu0, target, self.linear))
+
+        x = min(1.0, (j0 + n) / df)
+        if not self.linear:
+            x = (1.0 - _TH**x) / (1.0 - _TH)
 
-        if done:
+        value = (target - self._valu0) * x + self._valu0
+
+        if j0 + n >= df:
             self._state = next_state
-            self._start += start + len(curve)
-            self._valu0 = curve[-1]
+            self._start += j0 + n
+            self._valu0 = value
+
+        self._valu1 = value
+
+        return n
+
+
+#
+# The threshold of exponential envelope curves.
+#
+_TH = 0.01
+
+
+def render_segments(segments, frames, dtype="float64"):
+    """Render piecewise envelope curve segments in a fixed number of array
+    operations, regardless of the number of segments.
+
+    Args:
+        segments (list): Tuples of (offset, length, j0, df, v0, v1, linear)
+            where *offset* is the first frame of the segment, *j0* the
+            position of that frame in a curve that takes *df* frames to go
+            from level *v0* to level *v1*, and *linear* selects a linear or
+            exponential curve.
+        frames (int): The total number of frames.
+        dtype (str): Data type of the returned curve. Per segment
+            coefficients are always computed in double precision.
+
+    Returns:
+        ndarray
+    """
+    if not segments:
+        return np.zeros((frames,), dtype)
+
+    offset, length, j0, df, v0, v1, linear = np.array(segments, dtype="float64").T
+    n = length.astype("int64")
+
+    #
+    # At frame k of a segment the curve position is x = (k + c) / df, so the
+    # envelope is an affine function of k for linear segments, and an affine
+    # function of exp(k) for exponential ones. Both are folded into
+    # a + b * k + B * exp(p * k + q) with per segment coefficients.
+    #
+    c = j0 + 1 - offset
+    dv = v1 - v0
+    b = linear * dv / df
+
+    k = np.arange(frames, dtype=dtype)
+
+    if linear.all():
+        k *= np.repeat(b.astype(dtype), n)
+        k += np.repeat((v0 + b * c).astype(dtype), n)
+        return k
+
+    p = (1 - linear) * math.log(_TH) / df
+    B = (linear - 1) * dv / (1.0 - _TH)
+
+    pc = (p * c).astype(dtype)
+    v0c = (v0 + b * c - B).astype(dtype)
+
+    p, B, b = p.astype(dtype), B.astype(dtype), b.astype(dtype)
+
+    e = np.repeat(p, n) * k
+    e += np.repeat(pc, n)
+    np.exp(e, out=e)
+    e *= np.repeat(B, n)
 
-        self._valu1 = curve[-1]
+    k *= np.repeat(b, n)
+    k += np.repeat(v0c, n)
+    k += e
 
-        return curve
+    return k
@@ -1,11 +1,15 @@
 import functools
 import logging
-import time
+import math
+import threading
 
-import scipy
+# Import scipy.signal with the module, rather than on first use of the
+# scipy.signal attribute, which may be on the audio thread.
+import scipy.signal
 
 import numpy as np
 
+from .cache import load_arrays, save_arrays
 from .config import FPS
 from .sound import Sound, key2freq, freq2key
 
@@ -14,21 +18,49 @@ logger = logging.getLogger(__name__)
 
 
 class BaseFilter(Sound):
-    def __init__(self, freq=8192):
+    def __init__(self, freq=8192, step=None):
         super().__init__(freq=freq)
 
+        # If set, a modulated cutoff frequency is updated every *step* frames,
+        # with the filter state carried across, instead of once per block.
+        self.step = step
+
         self._f = None
         self._x = None
         self._z = None
 
+        # The coefficient table index of the latest sub-block, in step mode.
+        self._i = None
+
+        # Whether the latest block was computed together with other voices
+        # by forward_batch(), with state of a different form.
+        self._batched = False
+
     def reset(self, shared=False):
         super().reset(shared)
 
         self._f = None
         self._x = None
         self._z = None
+        self._i = None
+        self._batched = False
 
     def forward(self, x, key_modulation=None):
+        if self._batched:
+            # Restart from the previous block, as on a jump of the cutoff.
+            self._batched = False
+            self._f = self._z = self._i = None
+
+        if self.step and isinstance(key_modulation, np.ndarray):
+            return self.forward_varying(x, key_modulation)
+
+        return self.forward_block(x, key_modulation)
+
+    def forward_block(self, x, key_modulation=None):
+        """Filter with a cutoff frequency updated once per block, crossfading
+        from the previous cutoff frequency."""
+        self._i = None
+
         if self._x is None:
             self._x = x * 0
 
@@ -64,57 +96,311 @@ class BaseFilter(Sound):
         self._f = freq
         self._x = x
 
-        ww = np.arange(0.0, 1.0, 1 / len(x))[:, None]
+        # Counting frames, rather than stepping by 1 / len(x), which may
+        # yield an extra weight due to rounding with some block sizes.
+        ww = np.arange(len(x), dtype=x.dtype)[:, None]
+        ww /= len(x)
+
         a1 = a1 * ww + a0 * (1.0 - ww)
         return a1
 
+    def forward_varying(self, x, key_modulation):
+        """Filter with a cutoff frequency that follows the modulation signal,
+        updated at the center of each sub-block of *step* frames."""
+        keys = self.get_step_keys(key_modulation, len(x))
+        freqs = key2freq(keys).astype("int64")
+
+        a0 = np.empty(x.shape, x.dtype)
+
+        for i0, i1, freq in get_runs(freqs, self.step, len(x)):
+            a0[i0:i1], self._z = self.filter(x[i0:i1], freq, self._z)
+
+        self._f = int(freqs[-1])
+        self._x = x
+
+        return a0
+
+    def get_step_keys(self, key_modulation, frames):
+        """Get the cutoff frequency, in semitone units, of each sub-block."""
+        km = key_modulation.reshape(len(key_modulation), -1).mean(1)
+        ci = np.arange(self.step // 2, frames + self.step // 2, self.step)
+
+        return self.key + km[ci.clip(0, len(km) - 1)]
+
     def filter(self, x, freq, z=None):
         return x, None
 
 
+#
+# The largest change of coefficient table index, in tenths of a semitone,
+# across which step mode filters carry their state.
+#
+_MAX_STEP = 10
+
+
+def get_runs(values, step, frames):
+    """Split sub-block values into runs of equal values.
+
+    Args:
+        values (ndarray): A value for each sub-block of *step* frames.
+        step (int): The number of frames in a sub-block.
+        frames (int): The total number of frames.
+
+    Returns:
+        list: Tuples of (start frame, end frame, value).
+    """
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(values)) + 1))
+    ends = np.append(starts[1:] * step, frames)
+
+    return [(i * step, e, values[i]) for i, e in zip(starts.tolist(), ends.tolist())]
+
+
 def fround(freq):
     return key2freq(round(freq2key(freq), 1))
 
 
+def get_wp(freq, btype="lowpass", bandwidth=500):
+    """Get the passband edge frequencies for given cutoff frequency."""
+    freq = fround(freq)
+
+    nyq = FPS // 2
+
+    if btype[:3] in ("low", "hig"):
+        return max(1, min(nyq - 1, freq))
+
+    lc = max(1, min(nyq - 1, freq - bandwidth / 2))
+    hc = max(1, min(nyq - 1, freq + bandwidth / 2))
+
+    return (lc, hc)
+
+
 class ButterFilter(BaseFilter):
-    def __init__(self, freq=8192, btype="lowpass", db=24, bandwidth=500, output="ba"):
-        super().__init__(freq)
+    def __init__(
+        self,
+        freq=8192,
+        btype="lowpass",
+        db=24,
+        bandwidth=500,
+        output="ba",
+        step=None,
+    ):
+        super().__init__(freq, step)
 
         self.bandwidth = bandwidth
         self.output = output
         self.btype = {"l": "lowpass", "h": "highpass", "b": "bandpass"}[btype[0]]
         self.db = db
 
-        self.warmup()
+        # Filter coefficients are looked up in a shared table that is loaded
+        # from the on-disk cache, or computed in the background, as soon as
+        # the filter is created, rather than on the audio thread.
+        self._table = get_butter_table(self.btype, self.db, bandwidth, output)
+
+    @classmethod
+    def forward_batch(cls, filters, x, key_modulation=None):
+        """Filter the next block of a batch of filters of the same type, each
+        with its own cutoff frequency and state, with a FilterBank.
+
+        Args:
+            filters (list): ButterFilter objects.
+            x (ndarray): Array of shape (frames, nfilters).
+            key_modulation (ndarray, optional): Array of shape
+                (frames, nfilters) with the cutoff modulation of each filter.
+
+        Returns:
+            ndarray: Array of shape (frames, nfilters), or NotImplemented
+                if the filters can not be computed together.
+        """
+        f0 = filters[0]
+        n = len(filters)
+
+        if (
+            cls.forward is not BaseFilter.forward
+            or not isinstance(x, np.ndarray)
+            or x.shape[1:] != (n,)
+            or any(
+                f.step
+                or f.krate
+                or (f.btype, f.db, f.bandwidth) != (f0.btype, f0.db, f0.bandwidth)
+                for f in filters
+            )
+        ):
+            return NotImplemented
+
+        if key_modulation is not None:
+            if not isinstance(key_modulation, np.ndarray) or key_modulation.ndim != 2:
+                return NotImplemented
+
+            km = np.broadcast_to(key_modulation[-1], (n,))
+        else:
+            km = 0
+
+        # The bank uses the sos table, which is computed in the background
+        # too. Until it is ready the filters are computed one by one.
+        if get_butter_table(f0.btype, f0.db, f0.bandwidth, "sos") is None:
+            return NotImplemented
+
+        bank = FilterBank(n, f0.btype, f0.db, f0.bandwidth)
+
+        # Voices filtered one by one in the previous block start over, warmed
+        # up on their previous block.
+        m = len(f0._x) if f0._x is not None else 0
+
+        if m:
+            bank.x = np.zeros((m, n), x.dtype)
+
+        for i, f in enumerate(filters):
+            if m and f._x is not None and f._x.shape == (m, 1):
+                bank.x[:, i] = f._x[:, 0]
+
+            if f._batched and f._z.shape == bank.z.shape[:2]:
+                bank.z[:, :, i] = f._z
+                bank.i[i] = f._i
+
+        keys = np.array([f.key for f in filters]) + km
+        a0 = bank.filter(x, key2freq(keys))
+
+        for i, f in enumerate(filters):
+            f._batched = True
+            f._f = None
+            f._z = bank.z[:, :, i].copy()
+            f._i = int(bank.i[i])
+            f._x = x[:, i : i + 1]
+            f.frames = len(x)
+            f.index += len(x)
+            f._a0 = a0[:, i : i + 1]
+
+        return a0
 
     def warmup(self):
-        for freq in sorted(set(fround(f) for f in range(1, FPS // 2))):
-            signal_butter(self.get_wp(freq), 3, self.db, self.btype, self.output)
-            time.sleep(0)
+        """Load or compute the coefficient table of this filter, and the
+        table used by forward_batch(), and wait until they are ready."""
+        if self._table is None:
+            self._table = get_butter_table(
+                self.btype, self.db, self.bandwidth, self.output, wait=True
+            )
+
+        get_butter_table(self.btype, self.db, self.bandwidth, "sos", wait=True)
 
     def get_wp(self, freq):
-        freq = key2freq(round(freq2key(freq), 1))
+        return get_wp(freq, self.btype, self.bandwidth)
+
+    def get_coefficients(self, freq):
+        if self._table is None:
+            self._table = get_butter_table(
+                self.btype, self.db, self.bandwidth, self.output
+            )
+
+        if self._table is not None:
+            coefs = self._table.lookup(freq)
+            if coefs is not None:
+                return coefs
+
+        return signal_butter(self.get_wp(freq), 3, self.db, self.btype, self.output)
 
-        nyq = FPS // 2
+    def forward_varying(self, x, key_modulation):
+        # Use the padded table coefficients, which share the same state shape
+        # for all cutoff frequencies, so state carries across sub-blocks.
+        if self._table is None:
+            self._table = get_butter_table(
+                self.btype, self.db, self.bandwidth, self.output
+            )
+
+        # The table is computed in the background, rather than stalling the
+        # sound device. Until it is ready the cutoff is updated per block.
+        if self._table is None:
+            return self.forward_block(x, key_modulation)
+
+        keys = self.get_step_keys(key_modulation, len(x))
+        indices = self._table.indices(keys)
+
+        arrays = self._table.arrays
+
+        if self.output == "ba":
+            zshape = (arrays["z"].shape[1],) + x.shape[1:]
+        else:
+            zshape = arrays["z"].shape[1:] + x.shape[1:]
 
-        if self.btype[:3] in ("low", "hig"):
-            return max(1, min(nyq - 1, freq))
+        # State left by per block filtering belongs to other coefficients.
+        z = self._z
+        if z is None or z.shape != zshape or self._i is None:
+            z = None
 
-        lc = max(1, min(nyq - 1, freq - self.bandwidth / 2))
-        hc = max(1, min(nyq - 1, freq + self.bandwidth / 2))
+        a0 = np.empty(x.shape, x.dtype)
 
-        return (lc, hc)
+        for i0, i1, i in get_runs(indices, self.step, len(x)):
+            if z is None:
+                z = self.get_warm_state(i, x[:i0], zshape)
+                a0[i0:i1], z = self.filter_at(i, x[i0:i1], z)
+
+            elif abs(i - self._i) <= _MAX_STEP:
+                a0[i0:i1], z = self.filter_at(i, x[i0:i1], z)
+
+            else:
+                # State carried across a large change of coefficients may
+                # blow up. Instead, warm up the new coefficients on the
+                # latest input, and crossfade from the previous ones.
+                a1, _ = self.filter_at(self._i, x[i0:i1], z)
+
+                z = self.get_warm_state(i, x[:i0], zshape)
+                a2, z = self.filter_at(i, x[i0:i1], z)
+
+                ww = np.arange(i1 - i0, dtype=a1.dtype)[:, None]
+                ww /= i1 - i0
+
+                a0[i0:i1] = a2 * ww + a1 * (1.0 - ww)
+
+            self._i = i
+
+        self._z = z
+        self._f = int(key2freq(keys[-1]))
+        self._x = x
+
+        return a0
+
+    def filter_at(self, i, x, z):
+        """Filter with the coefficients of given table index."""
+        arrays = self._table.arrays
+
+        if self.output == "ba":
+            return scipy.signal.lfilter(arrays["b"][i], arrays["a"][i], x, 0, z)
+
+        return scipy.signal.sosfilt(arrays["sos"][i], x, 0, z)
+
+    def get_warm_state(self, i, x, zshape):
+        """Get the state of the coefficients of given table index after
+        filtering the previous block and given frames of the current one."""
+        if self._x is not None and self._x.shape[1:] == x.shape[1:]:
+            x = np.concatenate((self._x, x))
+
+        z = np.zeros(zshape)
+
+        if len(x):
+            _, z = self.filter_at(i, x, z)
+
+        return z
 
     def filter(self, x, freq, z=None, _retry=True):
         try:
-            wp = self.get_wp(freq)
-
             if self.output == "ba":
-                b, a, z0 = signal_butter(wp, 3, self.db, self.btype, self.output)
-                return scipy.signal.lfilter(b, a, x, 0, z0 if z is None else z)
+                b, a, z0 = self.get_coefficients(freq)
+                a0, z = scipy.signal.lfilter(b, a, x, 0, z0 if z is None else z)
+
+                # Transfer function coefficients of high order filters need
+                # double precision, so only the output is cast.
+                return a0.astype(x.dtype, copy=False), z
             else:
-                sos, z0 = signal_butter(wp, 3, self.db, self.btype, self.output)
-                return scipy.signal.sosfilt(sos, x, 0, z0 if z is None else z)
+                sos, z0 = self.get_coefficients(freq)
+
+                if z is None:
+                    z = z0
+
+                # Second order sections are stable in single precision.
+                if x.dtype != sos.dtype:
+                    sos = sos.astype(x.dtype)
+                    z = z.astype(x.dtype, copy=False)
+
+                return scipy.signal.sosfilt(sos, x, 0, z)
 
         except ValueError:
             if z is None or not _retry:
@@ -148,3 +434,349 @@ def signal_butter(wp, gpass=3, gstop=24, btype="lowpass", output="ba", fs=FPS):
         sos = scipy.signal.butter(N, Wn, btype, output="sos", fs=fs)
         z = scipy.signal.sosfilt_zi(sos)[:, :, None]
         return sos, z
+
+
+class ButterTable(object):
+    """A table of Butterworth filter coefficients for all cutoff frequencies
+    used by the filters, i.e. in steps of a tenth of a semitone.
+
+    Coefficients of different orders are padded to the same shape; `ba`
+    coefficients with trailing zeros and `sos` coefficients with pass-through
+    sections. The lookup() method strips the padding.
+
+    Args:
+        arrays (dict): The table arrays, as computed by build().
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.k0 = int(arrays["k0"][0])
+        self.size = len(arrays["n"])
+        self.output = "ba" if "b" in arrays else "sos"
+
+        # Map each entry to the nearest entry with valid coefficients.
+        valid = np.flatnonzero(np.asarray(arrays["n"]) >= 0)
+        nearest = np.searchsorted(valid, np.arange(self.size))
+        self._nearest = valid[nearest.clip(0, len(valid) - 1)]
+
+    def indices(self, keys):
+        """Get the table indices of an array of cutoff frequencies in
+        semitone units, clipped to the table range."""
+        i = np.rint(np.round(keys, 1) * 10).astype("int64") - self.k0
+
+        return self._nearest[i.clip(0, self.size - 1)]
+
+    def index(self, freq):
+        """Get the table index of given cutoff frequency, or None."""
+        i = round(round(freq2key(freq), 1) * 10) - self.k0
+
+        if 0 <= i < self.size:
+            return i
+
+    def lookup(self, freq):
+        """Get the coefficients of given cutoff frequency, in the same form
+        returned by signal_butter(), or None if out of range."""
+        i = self.index(freq)
+
+        if i is None or self.arrays["n"][i] < 0:
+            return None
+
+        n = int(self.arrays["n"][i])
+
+        if self.output == "ba":
+            b = self.arrays["b"][i, : n + 1]
+            a = self.arrays["a"][i, : n + 1]
+            z = self.arrays["z"][i, :n, None]
+            return b, a, z
+
+        sos = self.arrays["sos"][i, :n]
+        z = self.arrays["z"][i, :n, :, None]
+        return sos, z
+
+    @staticmethod
+    def build(btype, db, bandwidth, output, fs=FPS):
+        """Compute the table arrays for given filter parameters."""
+        nyq = fs // 2
+
+        if btype == "bandpass":
+            fmax = nyq + bandwidth / 2
+        else:
+            fmax = nyq
+
+        k0 = math.floor(freq2key(1) * 10)
+        k1 = math.ceil(freq2key(fmax) * 10)
+
+        coefs = []
+
+        for k in range(k0, k1 + 1):
+            wp = get_wp(key2freq(k / 10), btype, bandwidth)
+            try:
+                coefs.append(signal_butter(wp, 3, db, btype, output, fs))
+            except (ValueError, np.linalg.LinAlgError):
+                # Left out of the table, to be computed, and fail, on lookup.
+                coefs.append(None)
+
+        arrays = dict(k0=np.array([k0]))
+
+        if output == "ba":
+            n = np.array([len(c[0]) - 1 if c else -1 for c in coefs])
+            m = n.max()
+
+            arrays["n"] = n
+            arrays["b"] = np.zeros((len(coefs), m + 1))
+            arrays["a"] = np.zeros((len(coefs), m + 1))
+            arrays["z"] = np.zeros((len(coefs), m))
+
+            for i, c in enumerate(coefs):
+                if c:
+                    b, a, z = c
+                    arrays["b"][i, : n[i] + 1] = b
+                    arrays["a"][i, : n[i] + 1] = a
+                    arrays["z"][i, : n[i]] = z[:, 0]
+
+        else:
+            n = np.array([len(c[0]) if c else -1 for c in coefs])
+            m = n.max()
+
+            arrays["n"] = n
+            arrays["sos"] = np.zeros((len(coefs), m, 6))
+            arrays["sos"][:, :, [0, 3]] = 1
+            arrays["z"] = np.zeros((len(coefs), m, 2))
+
+            for i, c in enumerate(coefs):
+                if c:
+                    sos, z = c
+                    arrays["sos"][i, : n[i]] = sos
+                    arrays["z"][i, : n[i]] = z[:, :, 0]
+
+        return arrays
+
+
+class FilterBank(object):
+    """Butterworth filters for many voices, computed together.
+
+    Each voice has its own cutoff frequency and filter state, and the state
+    of all voices is kept in a single array of shape (sections, 2, voices).
+    Voices are grouped by cutoff frequency rounded to a tenth of a semitone,
+    as by fround(), and each group is filtered with a single sosfilt() call.
+
+    Coefficients come from the padded coefficient table, in which all
+    cutoff frequencies share the same number of sections, so the state of
+    a voice carries across changes of its cutoff frequency without filtering
+    the previous block again. Across jumps of more than a semitone, where
+    carried state may blow up, the new coefficients of a voice are warmed up
+    on its previous block instead, and crossfaded in from the previous ones.
+
+    Args:
+        voices (int): The initial number of voices.
+        btype (str): Filter type - one of `lowpass`, `highpass`, or `bandpass`.
+        db (float): Minimum attenuation in the stopband.
+        bandwidth (float): Width of the passband of bandpass filters.
+
+    Example:
+        >>> bank = FilterBank(8)
+        >>> a0, phase = get_wave_batch("saw", freq, phase, frames=512)
+        >>> a1 = bank.filter(a0, freq * 4)
+    """
+
+    def __init__(self, voices=0, btype="lowpass", db=24, bandwidth=500):
+        self.btype = {"l": "lowpass", "h": "highpass", "b": "bandpass"}[btype[0]]
+        self.table = get_butter_table(self.btype, db, bandwidth, "sos", wait=True)
+
+        sections = self.table.arrays["sos"].shape[1]
+
+        self.z = np.zeros((sections, 2, voices))
+
+        # The table index of each voice in the previous block, or -1, and
+        # the previous block, of shape (frames, voices).
+        self.i = np.full(voices, -1)
+        self.x = None
+
+    @property
+    def voices(self):
+        """int: The number of voices."""
+        return self.z.shape[2]
+
+    def resize(self, voices):
+        """Set the number of voices, keeping the state of existing voices.
+        New voices start from silence."""
+        z = np.zeros(self.z.shape[:2] + (voices,), self.z.dtype)
+        i = np.full(voices, -1)
+
+        n = min(voices, self.voices)
+        z[:, :, :n] = self.z[:, :, :n]
+        i[:n] = self.i[:n]
+
+        if self.x is not None:
+            x = np.zeros((len(self.x), voices), self.x.dtype)
+            x[:, :n] = self.x[:, :n]
+            self.x = x
+
+        self.z = z
+        self.i = i
+
+    def reset(self, voice=None):
+        """Clear the state of given voice, or of all voices."""
+        if voice is None:
+            self.z.fill(0)
+            self.i.fill(-1)
+            self.x = None
+        else:
+            self.z[:, :, voice] = 0
+            self.i[voice] = -1
+
+            if self.x is not None:
+                self.x[:, voice] = 0
+
+    def filter(self, x, freq):
+        """Filter the next block of all voices.
+
+        Args:
+            x (ndarray): Array of shape (frames, voices).
+            freq (float or ndarray): Cutoff frequency, either shared by all
+                voices or an array of shape (voices,).
+
+        Returns:
+            ndarray: Array of shape (frames, voices).
+        """
+        if x.shape[1] != self.voices:
+            self.resize(x.shape[1])
+
+        # Second order sections are stable in single precision.
+        if self.z.dtype != x.dtype:
+            self.z = self.z.astype(x.dtype)
+
+        keys = freq2key(np.broadcast_to(np.asarray(freq, "float64"), (self.voices,)))
+        indices = self.table.indices(keys)
+
+        jumps = np.flatnonzero((self.i >= 0) & (np.abs(indices - self.i) > _MAX_STEP))
+
+        if len(jumps):
+            # The output of the previous coefficients, to crossfade from.
+            a1, _ = self._filter(self.i[jumps], x[:, jumps], self.z[:, :, jumps])
+
+        # Voices that start, or whose cutoff jumps, are warmed up on their
+        # previous block, which is silence for new voices.
+        warm = np.concatenate((np.flatnonzero(self.i < 0), jumps))
+
+        if len(warm):
+            z = np.zeros(self.z.shape[:2] + (len(warm),), self.z.dtype)
+
+            if self.x is not None and self.x.shape[1:] == x.shape[1:]:
+                _, z = self._filter(indices[warm], self.x[:, warm], z)
+
+            self.z[:, :, warm] = z
+
+        a0, self.z = self._filter(indices, x, self.z)
+
+        if len(jumps):
+            ww = np.arange(len(x), dtype=x.dtype)[:, None]
+            ww /= len(x)
+
+            a0[:, jumps] = a0[:, jumps] * ww + a1 * (1.0 - ww)
+
+        self.i[:] = indices
+
+        if self.x is None or self.x.shape != x.shape or self.x.dtype != x.dtype:
+            self.x = x.copy()
+        else:
+            self.x[:] = x
+
+        return a0
+
+    def _filter(self, indices, x, z):
+        """Filter voices with the coefficients of given table indices, one
+        sosfilt() call per group of voices with the same index."""
+        sos = self.table.arrays["sos"]
+        groups = np.unique(indices).tolist()
+
+        if len(groups) == 1:
+            return scipy.signal.sosfilt(sos[groups[0]].astype(x.dtype), x, 0, z)
+
+        a0 = np.empty(x.shape, x.dtype)
+
+        for i in groups:
+            cols = np.flatnonzero(indices == i)
+
+            a0[:, cols], z[:, :, cols] = scipy.signal.sosfilt(
+                sos[i].astype(x.dtype), x[:, cols], 0, z[:, :, cols]
+            )
+
+        return a0, z
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+#
+# Mapping of key to an event that is set once the table being built is ready.
+#
+_builds = {}
+
+
+def get_butter_table(btype, db, bandwidth, output, fs=FPS, wait=False):
+    """Get the coefficient table for given filter parameters.
+
+    The table is loaded from the on-disk cache if available. Otherwise
+    it is computed, in a background thread unless *wait* is True, and saved
+    to the cache.
+
+    Returns:
+        ButterTable: The table, or None if it is not ready yet.
+    """
+    if btype != "bandpass":
+        bandwidth = None
+
+    key = (btype, db, bandwidth, output, fs)
+
+    table = _tables.get(key)
+    if table is not None or (key in _tables and not wait):
+        return table
+
+    build = None
+
+    with _tables_lock:
+        if key not in _tables:
+            # Memory-mapped copy-on-write, since scipy filter functions
+            # reject read-only coefficients.
+            arrays = load_arrays("butter", key + (scipy.__version__,), "c")
+
+            if arrays is not None:
+                _tables[key] = ButterTable(arrays)
+            else:
+                _tables[key] = None
+                build = _builds[key] = threading.Event()
+
+            if build is not None and not wait:
+                threading.Thread(
+                    target=_build_butter_table, args=(key, build), daemon=True
+                ).start()
+
+        pending = _builds.get(key)
+
+    # Wait for a table being built by another thread, rather than build the
+    # same table twice.
+    if wait and _tables[key] is None:
+        if build is None and pending is not None:
+            pending.wait()
+        else:
+            _build_butter_table(key, build)
+
+    return _tables[key]
+
+
+def _build_butter_table(key, event=None):
+    logger.info("Enter _build_butter_table(key=%r).", key)
+
+    btype, db, bandwidth, output, fs = key
+
+    try:
+        arrays = ButterTable.build(btype, db, bandwidth or 0, output, fs)
+        save_arrays("butter", key + (scipy.__version__,), arrays)
+
+        _tables[key] = ButterTable(arrays)
+
+    finally:
+        if event is not None:
+            _builds.pop(key, None)
+            event.set()
@@ -0,0 +1,294 @@
+import csv
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from .config import FPS
+from .recorder import RingBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics(object):
+    """Realtime health metrics of the sound device callback.
+
+    Recording a callback costs a few arithmetic operations and a single
+    row written to a preallocated ring buffer, so metrics may be left on
+    while playing. Statistics such as percentiles are only computed when
+    queried.
+
+    Args:
+        size (int): The number of latest callbacks to keep timings of.
+    """
+
+    def __init__(self, size=4096):
+        # Rows of (render time, block duration, voices), one for each callback.
+        self.timings = RingBuffer(size, 3)
+
+        self.callbacks = 0
+        self.frames = 0
+        self.xruns = 0
+        self.underflows = 0
+        self.overruns = 0
+        self.voices = 0
+        self.voices_max = 0
+
+    def add_callback(self, render_time, frames, voices, status=None):
+        duration = frames / FPS
+
+        self.timings.write((render_time, duration, voices))
+
+        self.callbacks += 1
+        self.frames += frames
+        self.voices = voices
+        self.voices_max = max(self.voices_max, voices)
+
+        if render_time > duration:
+            self.overruns += 1
+
+        if status:
+            self.xruns += 1
+            if getattr(status, "output_underflow", False):
+                self.underflows += 1
+
+    def get(self):
+        """Get a summary of the metrics.
+
+        Returns:
+            dict: Counters, and mean, maximum and percentiles of the render time
+                in seconds of the latest callbacks. The load is the render time
+                as a fraction of the duration of the block.
+        """
+        a0 = self.timings.read()
+
+        md = dict(
+            callbacks=self.callbacks,
+            frames=self.frames,
+            xruns=self.xruns,
+            underflows=self.underflows,
+            overruns=self.overruns,
+            voices=self.voices,
+            voices_max=self.voices_max,
+        )
+
+        if len(a0):
+            rt = a0[:, 0]
+            load = rt / a0[:, 1]
+
+            p50, p90, p99 = np.percentile(rt, [50, 90, 99])
+
+            md.update(
+                render_mean=float(rt.mean()),
+                render_max=float(rt.max()),
+                render_p50=float(p50),
+                render_p90=float(p90),
+                render_p99=float(p99),
+                load_mean=float(load.mean()),
+                load_max=float(load.max()),
+            )
+
+        return md
+
+    def histogram(self, bins=20):
+        """Get a histogram of the render time of the latest callbacks.
+
+        Returns:
+            tuple: Counts and bin edges in seconds, as returned by
+                ``np.histogram()``.
+        """
+        return np.histogram(self.timings.read()[:, 0], bins)
+
+
+class ForwardTimer(object):
+    """A sound tracer that accumulates the time spent in the forward() method
+    of each sound class.
+
+    Time spent in child sounds is subtracted, so each class is only
+    charged for its own work.
+    """
+
+    def __init__(self):
+        # Mapping of sound class to [calls, seconds].
+        self.stats = {}
+
+        self._local = threading.local()
+
+    def _get_stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            stack = self._local.stack = []
+            return stack
+
+    def enter(self, sound):
+        self._get_stack().append([time.perf_counter(), 0.0])
+
+    def exit(self, sound):
+        stack = self._get_stack()
+
+        t0, children = stack.pop()
+        dt = time.perf_counter() - t0
+
+        if stack:
+            stack[-1][1] += dt
+
+        st = self.stats.get(type(sound))
+
+        if st is None:
+            st = self.stats.setdefault(type(sound), [0, 0.0])
+
+        st[0] += 1
+        st[1] += dt - children
+
+    def get(self):
+        """Get mapping of sound class name to (calls, seconds)."""
+        return {k.__name__: tuple(v) for k, v in self.stats.items()}
+
+
+_metrics = None
+_timer = None
+
+
+def enable_metrics(enabled=True, forward=False, size=4096):
+    """Enable collecting metrics of the sound device callback.
+
+    Args:
+        enabled (bool): Enable or disable metrics.
+        forward (bool): Also time the forward() method of each sound class.
+            Timing sounds makes gated voices compute voice by voice rather
+            than in batches, so callbacks take longer than without it.
+        size (int): The number of latest callbacks to keep timings of.
+    """
+    global _metrics, _timer
+
+    from .sound import add_tracer, remove_tracer
+
+    logger.info("Enter enable_metrics(enabled=%r, forward=%r).", enabled, forward)
+
+    if _timer is not None:
+        remove_tracer(_timer)
+        _timer = None
+
+    _metrics = Metrics(size) if enabled else None
+
+    if enabled and forward:
+        _timer = ForwardTimer()
+        add_tracer(_timer)
+
+
+def record_callback(render_time, frames, voices, status=None):
+    """Record a sound device callback, if metrics are enabled."""
+    if _metrics is not None:
+        _metrics.add_callback(render_time, frames, voices, status)
+
+
+def get_metrics():
+    """Get a summary of the metrics, see ``Metrics.get()``.
+
+    If enabled with *forward*, the time spent in the forward() method of each
+    sound class is given under the ``forward`` key, as a mapping of class
+    name to (calls, seconds).
+
+    Returns:
+        dict: The metrics, or None if metrics are not enabled.
+    """
+    if _metrics is None:
+        return None
+
+    md = _metrics.get()
+
+    if _timer is not None:
+        md["forward"] = _timer.get()
+
+    return md
+
+
+def get_render_histogram(bins=20):
+    if _metrics is not None:
+        return _metrics.histogram(bins)
+
+
+def reset_metrics():
+    """Reset all counters and timings."""
+    if _metrics is not None:
+        enable_metrics(True, _timer is not None, _metrics.timings.size)
+
+
+_dump_stop = None
+
+_CSV_FIELDS = [
+    "time",
+    "callbacks",
+    "frames",
+    "xruns",
+    "underflows",
+    "overruns",
+    "voices",
+    "voices_max",
+    "render_mean",
+    "render_max",
+    "render_p50",
+    "render_p90",
+    "render_p99",
+    "load_mean",
+    "load_max",
+]
+
+
+def start_metrics_dump(interval=10, path=None):
+    """Periodically log the metrics, or append them to a CSV file.
+
+    Args:
+        interval (float): Seconds between dumps.
+        path (str, optional): Path of a CSV file to append rows to, instead of
+            logging.
+    """
+    global _dump_stop
+
+    stop_metrics_dump()
+
+    _dump_stop = threading.Event()
+
+    thread = threading.Thread(
+        target=_dump_metrics, args=(interval, path, _dump_stop), daemon=True
+    )
+    thread.start()
+
+
+def stop_metrics_dump():
+    global _dump_stop
+
+    if _dump_stop is not None:
+        _dump_stop.set()
+        _dump_stop = None
+
+
+def _dump_metrics(interval, path, stop):
+    while not stop.wait(interval):
+        md = get_metrics()
+
+        if md is None:
+            continue
+
+        md.pop("forward", None)
+
+        if not path:
+            logger.info("Metrics: %r.", md)
+            continue
+
+        md = dict(time=time.time(), **md)
+
+        try:
+            new = not os.path.exists(path)
+
+            with open(path, "a", newline="") as f:
+                w = csv.DictWriter(f, _CSV_FIELDS, extrasaction="ignore")
+                if new:
+                    w.writeheader()
+                w.writerow(md)
+
+        except OSError as e:
+            logger.error(e)
@@ -0,0 +1,168 @@
+import logging
+import wave
+
+import numpy as np
+
+from . import player
+from .config import FPS
+
+logger = logging.getLogger(__name__)
+
+
+class OfflineRenderer(object):
+    """Render playing sounds into numpy arrays, faster than realtime and
+    without a sound device.
+
+    While the renderer is active, the time seen by sound objects is a virtual
+    clock that advances by exactly the number of frames rendered, so notes
+    scheduled with ``play()``, ``open()`` or ``close()`` land on exact frames.
+    Sounds are mixed with the same code path used by the sound device
+    callback.
+
+    Args:
+        frames (int): The block size used to drive the mixer.
+        t0 (float): The virtual time at which rendering starts.
+        channels (int): Number of output channels.
+
+    Example:
+        >>> with OfflineRenderer() as r:
+        ...     synth.play(note=60, duration=1)
+        ...     r.render(2)
+        ...     r.save("out.wav")
+    """
+
+    def __init__(self, frames=8192, t0=0.0, channels=2):
+        self.frames = frames
+        self.t0 = t0
+        self.channels = channels
+
+        # The number of frames rendered so far.
+        self.index = 0
+
+        self._al = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def time(self):
+        """float: The current virtual time in seconds."""
+        return self.t0 + self.index / FPS
+
+    def start(self):
+        """Discard currently playing sounds and switch to the virtual clock.
+
+        The audio backend plays silence until the renderer stops.
+        """
+        logger.info("Enter OfflineRenderer.start().")
+
+        # Wait for the block the backend may be rendering.
+        with player._render_lock:
+            player.stop_sound()
+            player.set_schedule(None)
+            player.set_clock(self.time)
+
+    def stop(self):
+        """Switch back to the system clock."""
+        logger.info("Enter OfflineRenderer.stop().")
+
+        player.set_clock(None)
+
+    @property
+    def playing(self):
+        """bool: Whether any sound is still playing, or any sequencer has
+        events left to run."""
+        if any(sq.pending for sq in player._sequencers):
+            return True
+
+        return bool(player._sounds0 or player._sounds1)
+
+    def render(self, seconds=None, frames=None, limit=60):
+        """Render and return the next section of audio.
+
+        Args:
+            seconds (float, optional): Duration to render in seconds.
+            frames (int, optional): Duration to render in frames.
+            limit (float): If neither duration is given, render until all
+                sounds are done, but no more than this many seconds.
+
+        Returns:
+            ndarray: Array of shape (frames, channels).
+        """
+        if frames is None and seconds is not None:
+            frames = player.t2frames(seconds)
+
+        if frames is None:
+            al = []
+            total = player.t2frames(limit)
+            rendered = 0
+
+            while self.playing and rendered < total:
+                n = min(self.frames, total - rendered)
+                al.append(self.render(frames=n))
+                rendered += n
+
+            if not al:
+                return np.zeros((0, self.channels))
+
+            return np.concatenate(al)
+
+        a0 = np.zeros((frames, self.channels), player.get_dtype())
+
+        i0 = 0
+        while i0 < frames:
+            n = min(self.frames, frames - i0)
+            out = a0[i0 : i0 + n]
+
+            player.set_clock(self.time)
+            player._render(out, n)
+
+            self.index += n
+            i0 += n
+
+        player.set_clock(self.time)
+
+        self._al.append(a0)
+
+        return a0
+
+    @property
+    def output(self):
+        """ndarray: All audio rendered so far."""
+        if not self._al:
+            return np.zeros((0, self.channels))
+
+        if len(self._al) > 1:
+            self._al[:] = [np.concatenate(self._al)]
+
+        return self._al[0]
+
+    def save(self, path):
+        """Save all audio rendered so far to a WAV file."""
+        write_wav(path, self.output)
+
+
+def write_wav(path, a0, fps=FPS):
+    """Write array of samples between -1 and 1 to a 16 bit PCM WAV file.
+
+    Args:
+        path (str): Path of the file to write.
+        a0 (ndarray): Array of shape (frames,) or (frames, channels).
+        fps (int): Sample rate.
+    """
+    a0 = np.asarray(a0)
+
+    if a0.ndim == 1:
+        a0 = a0[:, None]
+
+    a1 = (a0.clip(-1, 1) * 32767).astype("<i2")
+
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(a1.shape[1])
+        wf.setsampwidth(2)
+        wf.setframerate(fps)
+        wf.writeframes(a1.tobytes())
@@ -1,123 +1,156 @@
 import numpy as np
 import math
-import functools
+import logging
+from .player import get_buffer, get_dtype, is_mixing
 from .sound import Sound, key2freq
 from .config import MIDDLE_C, FPS
+from .wavetable import get_wavetable_bank
 
-_NP_ZERO = np.zeros((1,), dtype="float64")
+logger = logging.getLogger(__name__)
 
+_2PI = 2 * math.pi
 
-def get_radians(freq, start=0, frames=8192):
-    pt = 2 * math.pi / FPS * freq
 
-    if isinstance(pt, np.ndarray):
-        pt = pt.reshape(-1)
-    else:
-        pt = pt * np.ones((frames,), dtype="float64")
+def get_radians(freq, start=0, frames=8192, dtype=None, out=None):
+    """Compute the phase of each frame of a wave of given frequency.
 
-    p0 = start + _NP_ZERO
-    p1 = np.concatenate((p0, pt))
-    p2 = np.cumsum(p1)
+    The phase of a constant frequency is a ramp computed without any
+    accumulation. A modulated phase is accumulated in double precision. In
+    both cases the next start phase is wrapped to [0, 2 pi), so precision
+    does not degrade as a note plays on, even if the returned phases are
+    single precision.
 
-    radians = p2[:-1]
-    next_start = p2[-1]
+    Args:
+        freq (float or ndarray): Frequency or array of frequencies.
+        start (float): The start phase.
+        frames (int): Number of frames to compute.
+        dtype (str, optional): Data type of the returned phases, by default
+            the player data type.
+        out (ndarray, optional): Buffer of shape (frames,) to write the phases
+            to, in which case no memory is allocated for a constant frequency.
+
+    Returns:
+        tuple: Array of phases and the next start phase.
+    """
+    if out is None:
+        out = np.empty((frames,), dtype or get_dtype())
 
-    return radians, next_start
+    if not isinstance(freq, np.ndarray):
+        pt = _2PI / FPS * freq
 
+        np.multiply(get_ramp(frames, out.dtype), pt, out=out)
+        out += start
 
-def get_sine_wave(freq, phase=0, frames=8192, **kwargs):
-    radians, phase_o = get_radians(freq, phase, frames)
+        return out, (start + pt * frames) % _2PI
 
-    a0 = np.sin(radians)
+    pt = np.multiply(freq.reshape(-1), _2PI / FPS, dtype="float64")
+    np.cumsum(pt, out=pt)
 
-    return a0, phase_o
+    out[0] = start
+    np.add(pt[:-1], start, out=out[1:])
 
+    return out, (start + pt[-1].item()) % _2PI
 
-def get_triangle_wave(freq, phase=0, frames=8192, **kwargs):
-    radians, phase_o = get_radians(freq, phase, frames)
 
-    a0 = radians % (2 * math.pi)
-    a1 = a0 / math.pi - 1
-    a2 = a1 * np.sign(-a1)
-    a3 = a2 * 2 + 1
+_ramps = {}
 
-    return a3, phase_o
 
+def get_ramp(frames, dtype="float64"):
+    """Get the shared read only array 0, 1, ..., frames - 1."""
+    key = (frames, np.dtype(dtype).name)
 
-@functools.lru_cache(maxsize=256)
-def get_sawtooth_cycle(nharmonics, size=1024):
-    k = nharmonics
-    radians = 2 * math.pi * np.arange(0, 1, 1 / size)
-    harmonic = -2 / math.pi * ((-1) ** k) / k * np.sin(k * radians)
+    a0 = _ramps.get(key)
 
-    if k == 1:
-        return harmonic
+    if a0 is None:
+        a0 = _ramps[key] = np.arange(frames, dtype=dtype)
+        a0.flags.writeable = False
 
-    return harmonic + get_sawtooth_cycle(nharmonics - 1, size)
+    return a0
 
 
-def get_sawtooth_wave(freq, phase=0, frames=8192, **kwargs):
-    radians, phase_o = get_radians(freq, phase, frames)
+def get_radians_batch(freq, start, frames=8192):
+    """Compute phases for a batch of voices of constant frequency.
 
-    size = 1024
+    Args:
+        freq (ndarray): Array of shape (nvoices,) with voice frequencies.
+        start (ndarray): Array of shape (nvoices,) with start phases.
+        frames (int): Number of frames to compute.
 
-    # Use mean frequency for the purpose of determining number of
-    # harmonics to use - this may introduce some aliasing.
-    if type(freq) not in (int, float):
-        freq = float(np.mean(freq))
+    Returns:
+        tuple: Array of shape (frames, nvoices) and array of next start phases.
+    """
+    pt = 2 * math.pi / FPS * freq
 
-    nharmonics = max(1, min(128, FPS / 2 // freq))
-    nharmonics = kwargs.get("nharmonics", nharmonics)
+    radians = start + pt * np.arange(frames, dtype="float64")[:, None]
+    next_start = (start + pt * frames) % _2PI
 
-    sawtooth = get_sawtooth_cycle(nharmonics, size)
+    return radians.astype(get_dtype(), copy=False), next_start
 
-    indices = (size / 2 / math.pi * radians).astype("int32") % size
-    samples = sawtooth[indices]
 
-    return samples, phase_o
+def get_nharmonics(freq, crossfade=False):
+    """Get the number of harmonics that fit below the Nyquist frequency.
 
+    Args:
+        freq (float or ndarray): Frequency or array of frequencies.
+        crossfade (bool): Return a fractional number of harmonics, for
+            gradually fading out the top harmonic as it approaches the Nyquist
+            frequency, rather than dropping it abruptly.
 
-_nduties = 64
-_nharmonics = 128
+    Returns:
+        int or ndarray
+    """
+    if crossfade:
+        return np.clip(FPS / 2 / freq - 1, 1, _nharmonics)
 
-_km = np.arange(0, _nharmonics + 1)[:, None, None]
-_dm = np.linspace(0, 1, _nduties + 1)[None, :, None]
-_kdm = _km * _dm
+    if isinstance(freq, np.ndarray):
+        return (FPS / 2 // freq).clip(1, _nharmonics).astype("int32")
 
+    return int(max(1, min(_nharmonics, FPS / 2 // freq)))
 
-@functools.lru_cache(maxsize=256)
-def get_square_cycle(nharmonics, size=1024):
-    k = nharmonics
-    radians = 2 * math.pi * np.arange(0, 1, 1 / size)
-    harmonic = (
-        4 / math.pi / k * np.sin(math.pi * _kdm[k]) * np.cos(k * radians)[None, :]
-    )
 
-    if k == 1:
-        return harmonic + 2 * _kdm[1] - 1
+#
+# The wave kernels below write into *out*, which may be the phase array
+# itself, and only use preallocated scratch buffers.
+#
 
-    return harmonic + get_square_cycle(nharmonics - 1, size)
 
+def _sine(radians, out=None):
+    return np.sin(radians, out=out)
 
-def get_square_wave(freq, phase=0, frames=8192, duty=0.5, **kwargs):
-    if isinstance(duty, np.ndarray):
-        duty = duty.reshape(-1).clip(0.01, 0.99)
 
-    radians, phase_o = get_radians(freq, phase, frames)
+def _triangle(radians, out=None):
+    a0 = np.remainder(radians, _2PI, out=out)
+    a0 /= math.pi
+    a0 -= 1
+    np.abs(a0, out=a0)
+    a0 *= -2
+    a0 += 1
 
-    # Use mean frequency for the purpose of determining number of
-    # harmonics to use - this may introduce some aliasing.
-    if type(freq) not in (int, float):
-        freq = float(np.mean(freq))
+    return a0
+
+
+def _get_indices(radians, size):
+    """Get wavetable indices of given phases, in a preallocated buffer."""
+    a0 = get_buffer("oscillator.scaled", radians.shape, radians.dtype)
+    i0 = get_buffer("oscillator.indices", radians.shape, "intp")
+
+    np.multiply(radians, size / _2PI, out=a0)
+    np.copyto(i0, a0, casting="unsafe")
+    np.remainder(i0, size, out=i0)
+
+    return i0
 
-    nharmonics = max(1, min(128, FPS / 2 // freq))
-    nharmonics = kwargs.get("nharmonics", nharmonics)
 
-    size = 1024
+def _sawtooth(radians, nharmonics, size=1024, out=None):
+    indices = _get_indices(radians, size)
+
+    return get_wavetable_bank(size).sawtooth(
+        indices, nharmonics, radians.dtype, out=out
+    )
 
-    square0 = get_square_cycle(nharmonics, size)
 
-    indices = (size / 2 / math.pi * radians).astype("int32") % size
+def _square(radians, nharmonics, duty=0.5, size=1024, out=None):
+    indices = _get_indices(radians, size)
 
     #
     # When duty is a modulating array, the following simple scheme
@@ -126,13 +159,102 @@ def get_square_wave(freq, phase=0, frames=8192, duty=0.5, **kwargs):
     # begining of wave cycles.
     #
     if type(duty) in (int, float):
-        duty = int(duty * _nduties)
+        duty = int(duty * _nduties) / _nduties
     else:
-        duty = (duty * _nduties).astype("int32")
+        duty = (duty * _nduties).astype("int32") / _nduties
+
+    return get_wavetable_bank(size).square(
+        indices, nharmonics, duty, radians.dtype, out=out
+    )
+
+
+def get_sine_wave(freq, phase=0, frames=8192, out=None, **kwargs):
+    radians, phase_o = get_radians(freq, phase, frames, out=out)
+
+    return _sine(radians, out=radians), phase_o
+
+
+def get_triangle_wave(freq, phase=0, frames=8192, out=None, **kwargs):
+    radians, phase_o = get_radians(freq, phase, frames, out=out)
+
+    return _triangle(radians, out=radians), phase_o
+
+
+def get_sawtooth_cycle(nharmonics, size=1024):
+    return get_wavetable_bank(size).sawtooth(np.arange(size), nharmonics)
+
+
+def get_sawtooth_wave(freq, phase=0, frames=8192, out=None, **kwargs):
+    radians, phase_o = get_radians(freq, phase, frames, out=out)
+
+    # The number of harmonics is selected per sample from the instantaneous
+    # frequency, so frequency modulated waves do not alias.
+    if isinstance(freq, np.ndarray):
+        freq = freq.reshape(-1)
+
+    nharmonics = get_nharmonics(freq, kwargs.get("crossfade", False))
+    nharmonics = kwargs.get("nharmonics", nharmonics)
+
+    return _sawtooth(radians, nharmonics, out=radians), phase_o
+
+
+_nduties = 64
+_nharmonics = 128
 
-    samples = square0[duty, indices]
 
-    return samples, phase_o
+def get_square_cycle(nharmonics, size=1024):
+    duty = np.linspace(0, 1, _nduties + 1)[:, None]
+    return get_wavetable_bank(size).square(np.arange(size), nharmonics, duty)
+
+
+def get_square_wave(freq, phase=0, frames=8192, duty=0.5, out=None, **kwargs):
+    if isinstance(duty, np.ndarray):
+        duty = duty.reshape(-1).clip(0.01, 0.99)
+
+    radians, phase_o = get_radians(freq, phase, frames, out=out)
+
+    # The number of harmonics is selected per sample from the instantaneous
+    # frequency, so frequency modulated waves do not alias.
+    if isinstance(freq, np.ndarray):
+        freq = freq.reshape(-1)
+
+    nharmonics = get_nharmonics(freq, kwargs.get("crossfade", False))
+    nharmonics = kwargs.get("nharmonics", nharmonics)
+
+    return _square(radians, nharmonics, duty, out=radians), phase_o
+
+
+_waves = dict(sine=_sine, tri=_triangle, saw=_sawtooth, square=_square)
+
+_get_wave = dict(
+    sine=get_sine_wave,
+    tri=get_triangle_wave,
+    square=get_square_wave,
+    saw=get_sawtooth_wave,
+)
+
+
+def get_wave_batch(shape, freq, phase, frames=8192):
+    """Compute a batch of waveforms of the same shape in a single pass.
+
+    Args:
+        shape (str): Waveform to generate - one of `sine`, `tri`, `saw`,
+            or `square`.
+        freq (ndarray): Array of shape (nvoices,) with voice frequencies.
+        phase (ndarray): Array of shape (nvoices,) with start phases.
+        frames (int): Number of frames to compute.
+
+    Returns:
+        tuple: Array of shape (frames, nvoices) and array of next phases.
+    """
+    radians, phase_o = get_radians_batch(freq, phase, frames)
+
+    if shape in ("saw", "square"):
+        a0 = _waves[shape](radians, get_nharmonics(freq))
+    else:
+        a0 = _waves[shape](radians)
+
+    return a0, phase_o
 
 
 class Oscillator(Sound):
@@ -164,23 +286,114 @@ class Oscillator(Sound):
 
         self.kwargs = kwargs
 
+        # Two output buffers used in turn while mixing, so the previous
+        # output, which consumers such as filters may hold on to, is not
+        # overwritten.
+        self._outs = [None, None]
+        self._outi = 0
+
     def forward(self, key_modulation=None, **kwargs):
         if key_modulation is not None:
             freq = key2freq(self.key + key_modulation)
         else:
             freq = self.freq
 
+        # At control rate each frame spans krate audio frames.
+        if self.krate:
+            freq = freq * self.krate
+
         if self.kwargs:
             kwargs = dict(kwargs)
             kwargs.update(self.kwargs)
 
-        get_wave = dict(
-            sine=get_sine_wave,
-            tri=get_triangle_wave,
-            square=get_square_wave,
-            saw=get_sawtooth_wave,
-        ).get(self.shape)
+        get_wave = _get_wave.get(self.shape)
+
+        a0, a1 = self._get_output()
+        _, self.phase = get_wave(freq, self.phase, self.frames, out=a1, **kwargs)
+
+        return a0
+
+    def _get_output(self):
+        """Get the next output buffer and a flat view of it.
+
+        Buffers are only reused while the player mixes the oscillator into
+        the output. Otherwise, e.g. when called directly, a new array is
+        returned, which the caller may keep.
+        """
+        if not is_mixing():
+            a0 = np.empty((self.frames, 1), get_dtype())
+            return a0, a0[:, 0]
+
+        self._outi ^= 1
+
+        outs = self._outs[self._outi]
+
+        if outs is None or len(outs[1]) != self.frames or outs[1].dtype != get_dtype():
+            a0 = np.empty((self.frames, 1), get_dtype())
+            outs = self._outs[self._outi] = (a0, a0[:, 0])
+
+        return outs
+
+    def _batch_key(self):
+        if self.kwargs or self.krate or type(self).forward is not Oscillator.forward:
+            return super()._batch_key()
+
+        return type(self), self.shape
+
+    @classmethod
+    def forward_batch(cls, oscillators, key_modulation=None):
+        """Compute the next block of a batch of oscillators of the same
+        shape, each with its own frequency and phase, as a single 2-D array
+        computation.
+
+        Args:
+            oscillators (list): Oscillator objects.
+
+        Returns:
+            ndarray: Array of shape (frames, noscillators), or NotImplemented
+                if the oscillators can not be computed together.
+        """
+        o0 = oscillators[0]
+
+        if (
+            key_modulation is not None
+            or cls.forward is not Oscillator.forward
+            or any(o.kwargs or o.krate or o.shape != o0.shape for o in oscillators)
+        ):
+            return NotImplemented
+
+        frames = o0.frames
+
+        freq = np.array([o.freq for o in oscillators], dtype="float64")
+        phase = np.array([o.phase for o in oscillators], dtype="float64")
+
+        a0, phase = get_wave_batch(o0.shape, freq, phase, frames)
+
+        for i, o in enumerate(oscillators):
+            o.phase = phase[i]
+            o.index += frames
+            o._a0 = a0[:, i : i + 1]
+
+        return a0
+
+    @classmethod
+    def consume_batch(cls, sounds, frames, out):
+        """Compute the next *frames* of a batch of oscillators of the same
+        shape as a single 2-D array computation.
+        """
+        if len(sounds) < 2:
+            return super().consume_batch(sounds, frames, out)
+
+        for s in sounds:
+            s.frames = frames
+
+        try:
+            a0 = cls.forward_batch(sounds)
+        except Exception as e:
+            logger.error(e)
+            a0 = NotImplemented
 
-        a0, self.phase = get_wave(freq, self.phase, self.frames, **kwargs)
+        if a0 is NotImplemented:
+            return super().consume_batch(sounds, frames, out)
 
-        return a0[:, None]
+        cls._mix_batch(sounds, a0, out)
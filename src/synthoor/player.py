@@ -1,20 +1,59 @@
-import _thread
+import collections
+import concurrent.futures
+import itertools
 import logging
-import queue
+import math
+import threading
 import time
 
-import sounddevice as sd
-
 import numpy as np
 
-from .config import FPS
+from .config import FPS, LATENCY
+from . import backends, metrics
+from .recorder import FrameRing, RingBuffer, StreamWriter
 
 logger = logging.getLogger(__name__)
 
 
+#
+# The audio backend that plays the output, or None if audio is disabled. The
+# sounddevice module is only imported once the backend starts.
+#
+_backend = backends.SoundDeviceBackend()
+_backend_started = False
+
+
+def set_backend(backend="sounddevice", **kwargs):
+    """Set the audio backend.
+
+    Args:
+        backend (str or Backend): A backend object, or the name of a backend -
+            one of `sounddevice`, `null`, or `file` - or None to disable audio.
+        **kwargs: Arguments of the named backend.
+
+    Example:
+        >>> set_backend("file", target=sys.stdout.buffer)
+    """
+    global _backend, _backend_started
+
+    logger.info("Enter set_backend(backend=%r).", backend)
+
+    if _backend_started:
+        _backend.stop()
+        _backend_started = False
+
+    if isinstance(backend, str):
+        backend = backends.get_backend_class(backend)(**kwargs)
+
+    _backend = backend
+
+
+def get_backend():
+    return _backend
+
+
 def disable_audio():
-    global sd
-    sd = None
+    set_backend(None)
 
 
 _schedule = None
@@ -30,10 +69,28 @@ def get_schedule():
 
 
 def t2frames(t):
-    return int(FPS * t)
+    return int(round(FPS * t))
+
+
+#
+# A virtual clock used by the offline renderer. While it is set, it replaces
+# the system time as the time base for scheduling and playing sounds.
+#
+_clock = None
+
+
+def set_clock(t):
+    global _clock
+    _clock = t
+
+
+def get_clock():
+    return _clock
 
 
 def get_time():
+    if _clock is not None:
+        return _clock
     return time.time()
 
 
@@ -44,36 +101,64 @@ def get_bpm():
     return _bpm
 
 
-_worker_tid = None
+def set_bpm(bpm):
+    global _bpm
+    _bpm = bpm
 
 
-def _init_worker_thread():
-    logger.info("Enter _init_worker_thread().")
+#
+# The sample clock, counting all frames rendered so far.
+#
+_frame = 0
 
-    global _worker_tid
 
-    if not _worker_tid and sd is not None:
-        _worker_tid = _thread.start_new_thread(_start_sound_stream, ())
+def get_frame():
+    return _frame
 
 
-#
-# This queue is only used to keep the sound stream running.
-#
-_workerq = queue.Queue()
-_sp = {}
+def get_frame_time():
+    """Get the time that corresponds to the current render position, in the
+    time base used to schedule gates.
 
+    Gate events scheduled for this time land on the first frame of the block
+    or sub-block currently being rendered.
+    """
+    if _clock is not None:
+        return _clock
 
-def _start_sound_stream():
-    """Start the sound device output stream handler."""
-    logger.info("Enter _start_sound_stream().")
+    if _schedule:
+        return _schedule - get_latency()
 
-    while True:
-        if _sp.pop("reset", None):
-            _reset()
-        with sd.OutputStream(
-            samplerate=FPS, channels=2, callback=_stream_callback, **_sp
-        ):
-            _workerq.get()
+    return time.time()
+
+
+def get_latency():
+    """Get the delay between the time a note is scheduled for and the time
+    it is played, including any render-ahead lookahead."""
+    return LATENCY + _ahead_latency
+
+
+def _start_backend():
+    """Start the audio backend, falling back to the null backend if the
+    sound device is not available, e.g. on a machine without PortAudio."""
+    logger.info("Enter _start_backend().")
+
+    global _backend, _backend_started
+
+    if _backend_started or _backend is None:
+        return
+
+    if _al is None:
+        _set_history(_al_seconds)
+
+    try:
+        _backend.start(_stream_callback)
+    except (ImportError, OSError) as e:
+        logger.error("Failed to start audio backend: %r. Using null backend.", e)
+        _backend = backends.NullBackend()
+        _backend.start(_stream_callback)
+
+    _backend_started = True
 
 
 _nresets = 0
@@ -82,37 +167,136 @@ _nresets = 0
 def _reset():
     global _nresets
 
-    sd._exit_handler()
-    sd._initialize()
+    _backend.reset()
 
     _nresets += 1
 
 
-def _set_stream_params(**kwargs):
-    _sp.update(kwargs)
-    _workerq.put(1)
+#
+# The latest output of the sound device, and its timers, for the
+# oscilloscope and for recording.
+#
+_al_seconds = 1
+_al = None
+_dt = None
 
+#
+# A writer that streams the output to disk, while recording to a file.
+#
+_writer = None
 
-_al_seconds = 1
-_al = []
 
+def start_recording(limit=60, path=None):
+    """Start recording the sound device output.
+
+    Args:
+        limit (float): The number of seconds of the latest output to keep in
+            memory.
+        path (str, optional): Path of a WAV file to stream the entire output
+            to, without a limit on its duration.
+    """
+    global _writer
 
-def start_recording(limit=60):
-    global _al_seconds
-    global _al
+    logger.info("Enter start_recording(limit=%r, path=%r).", limit, path)
 
-    _al_seconds = limit
-    _al.clear()
+    if _writer is not None:
+        _writer.close()
+
+    _set_history(limit)
+
+    _writer = StreamWriter(path, 2, FPS) if path else None
 
 
 def stop_recording():
-    global _al_seconds
+    """Stop recording.
+
+    Returns:
+        ndarray: The recorded output, or if recording to a file, a memory-mapped
+            array of the file content.
+    """
+    global _writer
 
-    a0 = np.concatenate(_al)
-    _al_seconds = 1
+    logger.info("Enter stop_recording().")
+
+    if _writer is not None:
+        a0 = _writer.close()
+        _writer = None
+    else:
+        a0 = get_history()
+
+    _set_history(1)
     return a0
 
 
+def get_history(seconds=None):
+    """Get the latest output of the sound device.
+
+    Args:
+        seconds (float, optional): Duration to get, by default all output
+            kept in memory.
+
+    Returns:
+        ndarray: Array of shape (frames, channels).
+    """
+    if _al is None:
+        return np.zeros((0, 2))
+
+    return _al.read(None if seconds is None else t2frames(seconds))
+
+
+def get_timers():
+    """Get timers of the latest sound device callbacks.
+
+    Returns:
+        ndarray: Array of rows (time, frames, inputBufferAdcTime,
+            outputBufferDacTime, currentTime), one for each callback.
+    """
+    if _dt is None:
+        return np.zeros((0, 5))
+
+    return _dt.read()
+
+
+def _set_history(seconds):
+    """Allocate and clear the history of the output.
+
+    The history is allocated on the caller's thread, rather than in the
+    sound device callback, since it may take many megabytes.
+    """
+    global _al, _al_seconds, _dt
+
+    _al_seconds = seconds
+    size = t2frames(seconds)
+
+    if _al is not None and _al.size == size:
+        _al.clear()
+        _dt.clear()
+        return
+
+    # Enough rows of timers for blocks of 64 frames or more.
+    al = RingBuffer(size, 2)
+    dt = RingBuffer(size // 64 + 1, 5)
+
+    # Zeroed memory is mapped lazily. Fault its pages in here, rather than
+    # as the callback first writes to them.
+    al.data.fill(0)
+
+    _al, _dt = al, dt
+
+
+def _record(a0, timers):
+    """Add output block and its timers to the history, and to the file
+    being recorded to."""
+    al, dt, w = _al, _dt, _writer
+
+    if al is not None and al.data.shape[1:] == a0.shape[1:]:
+        al.write(a0)
+        dt.write(timers)
+
+    if w is not None:
+        w.write(a0)
+
+
 def _get_default_sc_device():
     return None
 
@@ -121,7 +305,6 @@ _ot = 0
 _od = _get_default_sc_device()
 
 
-_dt = []
 _safety_event0 = 0
 
 
@@ -145,51 +328,339 @@ def _stream_callback(outdata, frames, _time, status):
 
         if _od != od_:
             _od = od_
-            _set_stream_params(reset=True)
-
-    set_schedule(t0 + dt)
+            _reset()
 
     if status:
         logger.warning("Stream callback called with status: %r.", status)
         _safety_event0 = t0
 
+    # In render-ahead mode the worker sets the schedule of the block it
+    # renders, ahead of the block played here.
+    if _ahead is not None:
+        a0 = _read_ahead(outdata, frames, t0 + dt)
+
     #
-    # Get all sound objects currently playing, mix them, and set the mixed
-    # array into the output buffer.
+    # While the offline renderer owns the clock and the playing sounds, the
+    # sound device plays silence, and leaves the schedule alone.
     #
+    elif not _render_lock.acquire(blocking=False):
+        outdata.fill(0)
+        return
 
-    sounds = _get_sounds()
-
-    if not sounds:
-        a0 = np.zeros_like(outdata)
     else:
-        a0 = _mix_sounds(sounds, frames)
+        try:
+            if _clock is not None:
+                outdata.fill(0)
+                return
 
-    a0 = (a0 * _master_volume).clip(-1, 1)
+            set_schedule(t0 + dt)
+            a0 = _render(outdata, frames)
+
+        finally:
+            _render_lock.release()
+
+    metrics.record_callback(time.time() - t0, frames, _nvoices, status)
 
     if t0 < _safety_event0 + 1:
         a0 *= max(0.01, min(1, t0 - _safety_event0))
 
-    outdata[:] = a0
-
     #
     # Aggregate the output data and timers for the oscilloscope.
     #
 
-    while len(_al) * frames > _al_seconds * FPS:
-        _al.pop(0)
-        _dt.pop(0)
-
-    _al.append(a0)
-    _dt.append(
+    _record(
+        a0,
         (
             t0,
             frames,
             _time.inputBufferAdcTime,
             _time.outputBufferDacTime,
             _time.currentTime,
-        )
+        ),
+    )
+
+
+#
+# In render-ahead mode a worker thread renders blocks into a ring ahead of
+# the sound device, and the callback only copies them out.
+#
+_ahead = None
+_ahead_frames = 0
+_ahead_latency = 0
+_ahead_anchor = None
+_ahead_wake = threading.Event()
+_ahead_stop = None
+
+
+def set_render_ahead(blocks=0, frames=512):
+    """Render audio on a dedicated worker thread, a few blocks ahead of the
+    sound device.
+
+    Slow sound objects or garbage collection pauses then delay the worker
+    instead of the sound device callback, at the cost of extra latency of
+    *blocks* x *frames* samples. Notes are scheduled with this extra latency
+    taken into account, so their timing is not affected.
+
+    Args:
+        blocks (int): The number of blocks to render ahead, or 0 to render
+            in the sound device callback.
+        frames (int): The number of frames in each block.
+    """
+    global _ahead, _ahead_frames, _ahead_latency, _ahead_anchor, _ahead_stop
+
+    logger.info("Enter set_render_ahead(blocks=%r, frames=%r).", blocks, frames)
+
+    if _ahead_stop is not None:
+        _ahead_stop.set()
+        _ahead_wake.set()
+        _ahead_stop = None
+
+    _ahead_anchor = None
+
+    if blocks < 1:
+        _ahead = None
+        _ahead_latency = 0
+        return
+
+    _ahead = FrameRing(blocks * frames, dtype=_dtype)
+    _ahead_frames = frames
+    _ahead_latency = blocks * frames / FPS
+    _ahead_stop = threading.Event()
+
+    thread = threading.Thread(
+        target=_render_ahead,
+        args=(_ahead, frames, _ahead_stop),
+        name="synthoor-render-ahead",
+        daemon=True,
     )
+    thread.start()
+
+
+def get_render_ahead():
+    if _ahead is None:
+        return 0
+    return _ahead.size // _ahead_frames
+
+
+def _render_ahead(ring, frames, stop):
+    """Keep the ring filled with rendered blocks."""
+    logger.info("Enter _render_ahead(frames=%r).", frames)
+
+    while not stop.is_set():
+        #
+        # Wait for the sound device to start, and for space in the ring.
+        # While the offline renderer owns the clock the worker stays idle.
+        #
+        if _ahead_anchor is None or ring.space < frames or _clock is not None:
+            _ahead_wake.wait(0.1)
+            _ahead_wake.clear()
+            continue
+
+        with _render_lock:
+            if _clock is not None:
+                continue
+
+            # The time at which the first frame of this block will be played.
+            t0, f0 = _ahead_anchor
+            set_schedule(t0 + (ring.head - f0) / FPS)
+
+            try:
+                _render(ring.get_write_buffer(frames), frames)
+            except Exception as e:
+                logger.error(e)
+                ring.get_write_buffer(frames).fill(0)
+
+        ring.commit(frames)
+
+
+def _read_ahead(outdata, frames, t0):
+    """Copy the next rendered frames from the ring into the output buffer.
+
+    Args:
+        outdata (ndarray): The sound device output buffer.
+        frames (int): The number of frames to copy.
+        t0 (float): The time at which the first frame will be played.
+
+    Returns:
+        ndarray: The output buffer.
+    """
+    global _ahead_anchor
+
+    ring = _ahead
+
+    _ahead_anchor = (t0, ring.tail)
+
+    n = ring.read(outdata)
+
+    if n < frames:
+        logger.debug("Render-ahead ring underflow by %r frames.", frames - n)
+        outdata[n:].fill(0)
+
+    _ahead_wake.set()
+
+    return outdata
+
+
+#
+# The number of voices mixed into the latest block.
+#
+_nvoices = 0
+
+#
+# Held while rendering for the backend, so the offline renderer can take
+# over the clock and the playing sounds between blocks.
+#
+_render_lock = threading.Lock()
+
+
+def _render(outdata, frames):
+    """Get all sound objects currently playing, mix them into the given
+    output buffer, and apply the master volume in place.
+
+    This is the rendering path shared by the sound device callback and the
+    offline renderer.
+
+    Args:
+        outdata (ndarray): The output buffer to mix into.
+        frames (int): The number of frames to render.
+
+    Returns:
+        ndarray: The output buffer.
+    """
+    global _frame, _nvoices
+
+    outdata.fill(0)
+
+    clock = _clock
+    schedule = _schedule
+
+    i0 = 0
+
+    while i0 < frames:
+        #
+        # Blocks are split at sequencer events so events land on exact frames.
+        #
+        if i0:
+            if clock is not None:
+                set_clock(clock + i0 / FPS)
+            if schedule:
+                set_schedule(schedule + i0 / FPS)
+
+        n = _run_sequencers(frames - i0)
+
+        sounds = _get_sounds()
+        _nvoices = len(sounds)
+
+        if sounds:
+            out = outdata if n == frames else outdata[i0 : i0 + n]
+            _mix_sounds(sounds, n, out)
+
+        _frame += n
+        i0 += n
+
+    np.multiply(outdata, _master_volume, out=outdata)
+    np.clip(outdata, -1, 1, out=outdata)
+
+    return outdata
+
+
+#
+# The data type of the audio buffers computed by sound objects.
+#
+_dtype = "float64"
+
+
+def set_dtype(dtype="float64"):
+    """Set the data type used to compute audio, either "float64", or
+    "float32" for half the memory bandwidth in every hot loop."""
+    global _dtype
+    _dtype = np.dtype(dtype).name
+
+
+def get_dtype():
+    return _dtype
+
+
+_local = threading.local()
+
+
+def get_buffer(name, shape, dtype="float64"):
+    """Get a preallocated buffer private to the calling thread.
+
+    The same buffer is returned on each call with the same arguments, so
+    its content is only valid until the next such call.
+
+    Args:
+        name (str): Name of the buffer.
+        shape (tuple): Shape of the buffer.
+        dtype (str): Data type of the buffer.
+
+    Returns:
+        ndarray
+    """
+    try:
+        bd = _local.buffers
+    except AttributeError:
+        bd = _local.buffers = {}
+
+    key = (name, shape, dtype)
+    a0 = bd.get(key)
+
+    if a0 is None:
+        a0 = bd[key] = np.zeros(shape, dtype)
+
+    return a0
+
+
+def is_mixing():
+    """Whether the calling thread is mixing playing sounds into the output.
+
+    Sounds may then return buffers that they reuse on later blocks. Arrays
+    returned to other callers must stay valid.
+    """
+    return getattr(_local, "mixing", False)
+
+
+#
+# An optional cache of the rendered notes of deterministic voices, see
+# RenderCache.
+#
+_render_cache = None
+
+
+def set_render_cache(cache=None):
+    global _render_cache
+    _render_cache = cache
+
+
+def get_render_cache():
+    return _render_cache
+
+
+_sequencers = []
+
+
+def add_sequencer(sequencer):
+    """Add sequencer to the set of sequencers run by the sample clock."""
+    if sequencer not in _sequencers:
+        _sequencers.append(sequencer)
+
+
+def remove_sequencer(sequencer):
+    if sequencer in _sequencers:
+        _sequencers.remove(sequencer)
+
+
+def _run_sequencers(frames):
+    """Run events due at the current frame of all sequencers.
+
+    Returns:
+        int: The number of frames until the next event, up to *frames*.
+    """
+    for sq in _sequencers:
+        frames = min(frames, sq.run(_frame + frames) - _frame)
+
+    return frames
 
 
 _master_volume = 0.5
@@ -210,24 +681,85 @@ def set_master_volume(amp):
 _sounds0 = []
 _sounds1 = []
 
+#
+# Mapping of playing sound to the sequence number of its latest start, to
+# tell the newest sounds from the oldest ones.
+#
+_started = {}
+_sequence = itertools.count()
+
 
 def stop_sound():
     _sounds0.clear()
     _sounds1.clear()
+    _started.clear()
+
+    _reset_mixer()
 
 
 def add_sound(sound):
     """Add sound to the set of currently playing sound objects."""
 
-    if sd is None:
-        return
+    if _clock is None:
+        if _backend is None:
+            return
 
-    if _worker_tid is None:
-        _init_worker_thread()
+        if not _backend_started:
+            _start_backend()
 
+    _started[sound] = next(_sequence)
     _sounds0.append(sound)
 
 
+def remove_sound(sound):
+    """Stop playing given sound object."""
+    while sound in _sounds0:
+        _sounds0.remove(sound)
+
+    while sound in _sounds1:
+        _sounds1.remove(sound)
+
+    _started.pop(sound, None)
+
+
+def is_playing(sound):
+    return sound in _sounds0 or sound in _sounds1
+
+
+#
+# The maximum number of voices to render. When exceeded, the voices started
+# most recently are kept, and the others are cut off at once, mid-note, which
+# may click. Use a VoiceManager to bound the voices of an instrument.
+#
+_max_voices = None
+
+
+def set_max_voices(voices=None):
+    global _max_voices
+    _max_voices = voices
+
+
+def get_max_voices():
+    return _max_voices
+
+
+#
+# When batching is enabled, voices that share a batch key, e.g. oscillators
+# of the same shape, or gated voices of the same class and parameters, are
+# computed together by their class consume_batch().
+#
+_batching = False
+
+
+def set_batching(enabled=True):
+    global _batching
+    _batching = enabled
+
+
+def get_batching():
+    return _batching
+
+
 def _get_sounds():
     """Get currently playing sound objects."""
 
@@ -246,34 +778,363 @@ def _get_sounds():
             sl_.append(s)
             sd_.add(s)
 
+    if _max_voices is not None and len(sl_) > _max_voices:
+        logger.debug("Dropping %r voices over the limit.", len(sl_) - _max_voices)
+
+        sl_.sort(key=lambda s: _started.get(s, -1), reverse=True)
+        del sl_[_max_voices:]
+
     _sounds1[:] = sl_
 
+    # Forget sounds that are done, or dropped, unless started again since.
+    if len(_started) > len(sl_):
+        sd_ = set(sl_)
+
+        for s in list(_started):
+            if s not in sd_ and s not in _sounds0:
+                _started.pop(s, None)
+
     return sl_
 
 
-def _mix_sounds(sounds, frames):
-    """Mix sound data from given sounds into a single numpy array.
+#
+# An optional pool of threads used to render groups of voices in parallel.
+#
+_pool = None
+_pool_threads = 0
+_pool_deadline = 0.5
+
+#
+# Voice groups that missed the deadline, mapped from their future to a tuple
+# of (busy sounds, output buffer, lane).
+#
+_late = {}
+
+#
+# Voices that missed the deadline play behind the other voices from then
+# on, through the lanes of the mixer. These voices, and the sounds they share
+# with other voices, are busy until their lane is done.
+#
+_lanes = []
+_busy = set()
+
+
+class _Lane(object):
+    """A queue of blocks rendered by voices that play behind the others.
+
+    Queued blocks are mixed frame by frame into the following blocks,
+    however these are split, and the voices render the next block once
+    their previous block is done, so they never overlap themselves.
+    """
+
+    def __init__(self, busy):
+        self.busy = set(busy)
+        self.voices = set(self.busy)
+
+        # Blocks as [buffer, frames mixed] pairs.
+        self.queue = collections.deque()
+
+        # The future of the block being rendered, or None.
+        self.future = None
+
+    def mix(self, out):
+        """Mix the next queued frames into given output buffer."""
+        i0 = 0
+
+        while self.queue and i0 < len(out):
+            c = self.queue[0]
+            a0, j0 = c
+            n = min(len(a0) - j0, len(out) - i0)
+
+            np.add(out[i0 : i0 + n], a0[j0 : j0 + n], out=out[i0 : i0 + n])
+
+            c[1] += n
+            i0 += n
+
+            if c[1] == len(a0):
+                self.queue.popleft()
+                _free.append(a0)
+
+
+def _reset_mixer():
+    """Drop late voice groups and their lanes."""
+    _late.clear()
+    _lanes.clear()
+    _busy.clear()
+
+
+def set_mixer_threads(threads=0, deadline=0.5):
+    """Render voices in parallel on a persistent pool of threads.
+
+    Voice groups that are not done rendering by the deadline are mixed into
+    the next block instead of delaying the current one, and their voices
+    play behind the others from then on.
+
+    Args:
+        threads (int): Number of threads, or 0 to render on the calling
+            thread.
+        deadline (float): Time to wait for voices to render, as a fraction
+            of the duration of the block.
+    """
+    global _pool, _pool_threads, _pool_deadline
+
+    logger.info(
+        "Enter set_mixer_threads(threads=%r, deadline=%r).", threads, deadline
+    )
+
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+
+    _reset_mixer()
+
+    if threads > 1:
+        _pool = concurrent.futures.ThreadPoolExecutor(
+            threads, thread_name_prefix="synthoor-mixer"
+        )
+    else:
+        _pool = None
+
+    _pool_threads = threads
+    _pool_deadline = deadline
+
+
+def get_mixer_threads():
+    return _pool_threads
+
+
+def _mix_sounds(sounds, frames, out):
+    """Mix sound data from given sounds into the given output buffer.
 
     Args:
         sounds: Currently playing sound objects.
         frames (int): Number of frames to consume from each sound object.
+        out (ndarray): The buffer to add the sound data to.
 
     Returns:
-        ndarray
+        ndarray: The output buffer.
     """
     es = {}
 
     for s0 in sounds:
-        es.setdefault((), []).append(s0)
+        key = s0._batch_key() if _batching else ()
+        es.setdefault(key, []).append(s0)
 
-    al = []
+    if _pool is not None:
+        return _mix_sounds_parallel(list(es.values()), frames, out)
 
     for _, sl in es.items():
-        a0 = _mix_sounds0(sl, frames)
-        al.append(a0)
-    return np.stack(al).sum(0)
+        _mix_sounds0(sl, frames, out)
+
+    return out
+
+
+#
+# Output buffers of the mixer thread pool tasks, available for reuse.
+#
+_free = []
+
+
+def _mix_sounds_parallel(groups, frames, out):
+    """Mix voice groups on the thread pool into the given output buffer.
+
+    Voices that share sounds are mixed on the same thread, one after the
+    other.
+
+    Args:
+        groups (list): Lists of voices with the same batch key.
+        frames (int): Number of frames to consume from each sound object.
+        out (ndarray): The buffer to add the sound data to.
+
+    Returns:
+        ndarray: The output buffer.
+    """
+    for f in [f for f in _late if f.done()]:
+        busy, a0, lane = _late.pop(f)
+        _queue_result(f, busy, a0, lane)
+
+    playing = set()
+
+    for sl in groups:
+        playing.update(sl)
+
+    for lane in list(_lanes):
+        lane.mix(out)
+        lane.voices &= playing
+
+        if not lane.voices and not lane.queue and lane.future is None:
+            _lanes.remove(lane)
+            _busy.difference_update(lane.busy)
+
+    nvoices = sum(len(sl) for sl in groups)
+    chunk = max(1, math.ceil(nvoices / _pool_threads))
+
+    tasks = []
+    shared = {}
+
+    for sl in groups:
+        sl0 = []
+
+        for s in sl:
+            if s in _busy:
+                continue
+
+            ss = _get_shared(s)
+
+            # Voices that share sounds with voices of a lane join it.
+            if not _busy.isdisjoint(ss):
+                _join_lane(s, ss)
+            elif ss:
+                shared[s] = ss
+            else:
+                sl0.append(s)
+
+        for i in range(0, len(sl0), chunk):
+            tasks.append(([sl0[i : i + chunk]], sl0[i : i + chunk], None))
+
+    for cluster, ss in _get_clusters(shared):
+        task = [[s for s in sl if s in cluster] for sl in groups]
+        tasks.append(([sl for sl in task if sl], list(cluster) + ss, None))
+
+    for lane in _lanes:
+        if lane.voices and lane.future is None:
+            task = [[s for s in sl if s in lane.voices] for sl in groups]
+            tasks.append(([sl for sl in task if sl], (), lane))
+
+    fs = {}
+
+    for task, busy, lane in tasks:
+        a0 = _get_free_buffer(out)
+        f = _pool.submit(_mix_groups, task, frames, a0)
+        fs[f] = busy, a0, lane
+
+        if lane is not None:
+            lane.future = f
+
+    # Offline rendering is not bound by a deadline.
+    timeout = None if _clock is not None else _pool_deadline * frames / FPS
+
+    done, pending = concurrent.futures.wait(fs, timeout)
+
+    for f in done:
+        busy, a0, lane = fs[f]
+
+        if lane is not None:
+            _queue_result(f, busy, a0, lane)
+
+        else:
+            if _get_result(f) is not None:
+                np.add(out, a0, out=out)
+
+            _free.append(a0)
+
+    for f in pending:
+        logger.debug("Voice group missed the mixer deadline.")
+        _late[f] = fs[f]
+        _busy.update(fs[f][0])
+
+    return out
+
+
+def _queue_result(future, busy, a0, lane):
+    """Queue the output of a voice group in its lane, starting a lane if
+    the group was late."""
+    if lane is None:
+        lane = _Lane(busy)
+        _lanes.append(lane)
+
+    lane.future = None
+
+    if _get_result(future) is not None:
+        lane.queue.append([a0, 0])
+    else:
+        _free.append(a0)
+
+
+def _join_lane(sound, shared):
+    for lane in _lanes:
+        if not lane.busy.isdisjoint(shared):
+            lane.voices.add(sound)
+            lane.busy.add(sound)
+            lane.busy.update(shared)
+            _busy.add(sound)
+            _busy.update(shared)
+            return
+
+
+def _get_shared(sound):
+    """Get the sounds in the tree of given voice that other voices may
+    share, including the voice itself."""
+    ss = [s for s, shared in sound._plan or () if shared or s._shared]
+
+    if sound._shared:
+        ss.append(sound)
+
+    return ss
+
+
+def _get_clusters(shared):
+    """Split voices into clusters of voices that share sounds.
+
+    Args:
+        shared (dict): Mapping of voice to the sounds it may share.
+
+    Returns:
+        list: List of (set of voices, list of shared sounds) tuples.
+    """
+    clusters = []
+
+    for s, ss in shared.items():
+        voices, sounds = {s}, list(ss)
+        ids = {id(s1) for s1 in ss}
+
+        for c in list(clusters):
+            if not ids.isdisjoint(c[2]):
+                clusters.remove(c)
+                voices |= c[0]
+                sounds += c[1]
+                ids |= c[2]
+
+        clusters.append((voices, sounds, ids))
+
+    return [(voices, sounds) for voices, sounds, _ in clusters]
+
+
+def _mix_groups(groups, frames, out):
+    for sl in groups:
+        _mix_sounds0(sl, frames, out)
+
+    return out
+
+
+def _get_free_buffer(out):
+    while _free:
+        a0 = _free.pop()
+        if a0.shape == out.shape and a0.dtype == out.dtype:
+            a0.fill(0)
+            return a0
+
+    return np.zeros_like(out)
+
+
+def _get_result(future):
+    try:
+        return future.result()
+    except Exception as e:
+        logger.error(e)
+
+
+def _mix_sounds0(sounds, frames, out):
+    _local.mixing = True
+
+    try:
+        if _batching and len(sounds) > 1:
+            type(sounds[0]).consume_batch(sounds, frames, out)
+            return out
+
+        for s in sounds:
+            s.mix(out, frames)
 
+        return out
 
-def _mix_sounds0(sounds, frames):
-    al = [s.consume(frames) for s in sounds]
-    return np.stack(al).sum(0)
+    finally:
+        _local.mixing = False
@@ -0,0 +1,279 @@
+import json
+import logging
+import threading
+import time
+import tracemalloc
+
+from . import player
+from .sound import add_tracer, remove_tracer
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler(object):
+    """A per-node profiler of sound graphs.
+
+    While profiling, each call to the forward() method of each sound is
+    timed, and charged to its stack - the path of nested sounds from the
+    voice being rendered down to the sound itself, e.g.
+    ``TB303;filter:ButterFilter``. For each stack the profiler counts calls,
+    total and self time, where self time excludes child sounds, and the
+    peak memory allocated during the call.
+
+    Stacks are kept per thread, so voices rendered on the mixer thread pool
+    are profiled too. Memory is traced with tracemalloc, which is process
+    wide and slows rendering down considerably. While profiling, gated
+    voices are computed voice by voice rather than in batches, see
+    ``GatedSound.consume_batch()``.
+
+    Args:
+        memory (bool): Also measure memory allocated by each sound.
+
+    Example:
+        >>> with OfflineRenderer() as r, Profiler() as p:
+        ...     synth.play(note=60, duration=1)
+        ...     r.render(2)
+        >>> p.save_collapsed("render.folded")  # flamegraph.pl render.folded
+    """
+
+    def __init__(self, memory=True):
+        self.memory = memory
+
+        # The number of frames rendered, and the wall time spent, while
+        # profiling.
+        self.frames = 0
+        self.seconds = 0.0
+
+        # Mappings of stack to [calls, total, self, alloc, alloc max], one
+        # for each thread.
+        self._stats = []
+
+        # Mapping of (parent id, sound id) to (parent, sound, label).
+        self._labels = {}
+
+        self._local = threading.local()
+
+        self._active = False
+        self._tracing = False
+        self._frame0 = 0
+        self._end = None
+        self._t0 = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self, seconds=None):
+        """Start profiling.
+
+        Args:
+            seconds (float, optional): Stop profiling once this many seconds
+                of audio are rendered, e.g. to profile a window of a live
+                session.
+        """
+        logger.info("Enter Profiler.start(seconds=%r).", seconds)
+
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+
+        self._frame0 = player.get_frame()
+        self._end = None if seconds is None else self._frame0 + player.t2frames(seconds)
+        self._t0 = time.perf_counter()
+        self._active = True
+
+        add_tracer(self)
+
+    def stop(self):
+        logger.info("Enter Profiler.stop().")
+
+        remove_tracer(self)
+
+        self._close()
+
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def _close(self):
+        """End the profiling window."""
+        if not self._active:
+            return
+
+        self._active = False
+
+        self.frames += player.get_frame() - self._frame0
+        self.seconds += time.perf_counter() - self._t0
+
+    def reset(self):
+        """Discard all statistics."""
+        self.frames = 0
+        self.seconds = 0.0
+
+        self._stats = []
+        self._labels.clear()
+        self._local = threading.local()
+
+        if self._active:
+            self._frame0 = player.get_frame()
+            self._t0 = time.perf_counter()
+
+    def _get_local(self):
+        try:
+            return self._local.stack, self._local.stats
+        except AttributeError:
+            stack = self._local.stack = []
+            stats = self._local.stats = {}
+            self._stats.append(stats)
+            return stack, stats
+
+    def _get_label(self, parent, sound):
+        """Get label of given sound, named after its attribute in parent."""
+        key = (id(parent), id(sound))
+        v = self._labels.get(key)
+
+        if v is None:
+            label = type(sound).__name__
+
+            for k, s in parent.__dict__.items():
+                if s is sound:
+                    label = "%s:%s" % (k, label)
+                    break
+
+            v = self._labels[key] = (parent, sound, label)
+
+        return v[2]
+
+    #
+    # The profiler is a sound tracer. A frame of (stack, sound, start time,
+    # children time, start memory, children peak memory) is pushed when a
+    # sound enters its forward() method, and popped when it exits.
+    #
+
+    def enter(self, sound):
+        stack, _ = self._get_local()
+
+        if stack:
+            parent = stack[-1]
+            path = parent[0] + (self._get_label(parent[1], sound),)
+        else:
+            # A new window starts only at the top of the graph, so the stack
+            # of each thread stays balanced.
+            if not self._active:
+                return
+
+            if self._end is not None and player.get_frame() >= self._end:
+                self._close()
+                return
+
+            parent = None
+            path = (type(sound).__name__,)
+
+        m0 = 0
+
+        if self._tracing:
+            m0, peak = tracemalloc.get_traced_memory()
+
+            if parent is not None:
+                parent[5] = max(parent[5], peak)
+
+            tracemalloc.reset_peak()
+
+        stack.append([path, sound, 0.0, 0.0, m0, m0])
+
+        stack[-1][2] = time.perf_counter()
+
+    def exit(self, sound):
+        t1 = time.perf_counter()
+
+        stack, stats = self._get_local()
+
+        if not stack:
+            return
+
+        path, _, t0, children, m0, peak = stack.pop()
+
+        dt = t1 - t0
+
+        if stack:
+            stack[-1][3] += dt
+
+        alloc = 0
+
+        if self._tracing:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            alloc = peak - m0
+
+            if stack:
+                stack[-1][5] = max(stack[-1][5], peak)
+
+            tracemalloc.reset_peak()
+
+        st = stats.get(path)
+
+        if st is None:
+            st = stats[path] = [0, 0.0, 0.0, 0, 0]
+
+        st[0] += 1
+        st[1] += dt
+        st[2] += dt - children
+        st[3] += alloc
+        st[4] = max(st[4], alloc)
+
+    def get(self):
+        """Get statistics of each stack.
+
+        Returns:
+            dict: Mapping of stack tuple to dict of calls, total and self time
+                in seconds, and total and maximum bytes allocated per call.
+        """
+        merged = {}
+
+        for stats in list(self._stats):
+            for path, st in list(stats.items()):
+                m = merged.setdefault(path, [0, 0.0, 0.0, 0, 0])
+                m[0] += st[0]
+                m[1] += st[1]
+                m[2] += st[2]
+                m[3] += st[3]
+                m[4] = max(m[4], st[4])
+
+        return {
+            k: dict(calls=v[0], total=v[1], self=v[2], alloc=v[3], alloc_max=v[4])
+            for k, v in merged.items()
+        }
+
+    def get_report(self):
+        """Get a report of the profiling window, with the statistics of each
+        stack, ordered by self time.
+
+        Returns:
+            dict
+        """
+        nodes = [dict(stack=";".join(k), **v) for k, v in self.get().items()]
+        nodes.sort(key=lambda n: n["self"], reverse=True)
+
+        return dict(frames=self.frames, seconds=self.seconds, nodes=nodes)
+
+    def get_collapsed(self):
+        """Get the self time of each stack in collapsed stack format, one
+        line of ``stack microseconds`` each, as read by flamegraph tools.
+
+        Returns:
+            list: Lines of text.
+        """
+        return [
+            "%s %d" % (";".join(k), round(v["self"] * 1e6))
+            for k, v in sorted(self.get().items())
+        ]
+
+    def save_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.get_report(), f, indent=2)
+
+    def save_collapsed(self, path):
+        with open(path, "w") as f:
+            f.write("\n".join(self.get_collapsed()) + "\n")
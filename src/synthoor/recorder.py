@@ -0,0 +1,250 @@
+import logging
+import queue
+import struct
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RingBuffer(object):
+    """A preallocated ring buffer that keeps the latest rows written to it.
+
+    Writing copies the rows into place without allocating, so it is safe to
+    use from the sound device callback.
+
+    Args:
+        size (int): The number of rows to keep.
+        channels (int): The number of columns of each row.
+        dtype (str): Data type of the buffer.
+    """
+
+    def __init__(self, size, channels=2, dtype="float64"):
+        self.data = np.zeros((max(1, size), channels), dtype)
+
+        # The total number of rows written so far.
+        self.index = 0
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def __len__(self):
+        return min(self.index, self.size)
+
+    def clear(self):
+        self.index = 0
+
+    def write(self, a0):
+        """Write given array of shape (rows, channels) or (channels,)."""
+        a0 = np.asarray(a0)
+
+        if a0.ndim == 1:
+            a0 = a0[None, :]
+
+        if len(a0) > self.size:
+            self.index += len(a0) - self.size
+            a0 = a0[-self.size :]
+
+        i0 = self.index % self.size
+        i1 = min(i0 + len(a0), self.size)
+
+        self.data[i0:i1] = a0[: i1 - i0]
+        self.data[: len(a0) - (i1 - i0)] = a0[i1 - i0 :]
+
+        self.index += len(a0)
+
+    def read(self, rows=None):
+        """Read the latest rows in the order they were written.
+
+        Args:
+            rows (int, optional): The number of rows to read, by default all
+                rows in the buffer.
+
+        Returns:
+            ndarray: A copy of the rows.
+        """
+        n = len(self) if rows is None else min(rows, len(self))
+
+        i1 = self.index % self.size
+        i0 = i1 - n
+
+        if i0 >= 0:
+            return self.data[i0:i1].copy()
+
+        return np.concatenate([self.data[i0:], self.data[:i1]])
+
+
+class FrameRing(object):
+    """A single producer, single consumer ring of audio frames.
+
+    The producer only advances *head* and the consumer only advances *tail*,
+    so frames are handed over between two threads without a lock.
+
+    Args:
+        size (int): The capacity of the ring in frames.
+        channels (int): Number of channels.
+        dtype (str): Data type of the ring.
+    """
+
+    def __init__(self, size, channels=2, dtype="float64"):
+        self.data = np.zeros((size, channels), dtype)
+
+        # The total number of frames written and read so far.
+        self.head = 0
+        self.tail = 0
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    @property
+    def available(self):
+        """int: The number of frames that may be read."""
+        return self.head - self.tail
+
+    @property
+    def space(self):
+        """int: The number of frames that may be written."""
+        return self.size - (self.head - self.tail)
+
+    def get_write_buffer(self, frames):
+        """Get a view of the next *frames* to write, which must not wrap
+        around the end of the ring. Call commit() once written."""
+        i0 = self.head % self.size
+        return self.data[i0 : i0 + frames]
+
+    def commit(self, frames):
+        self.head += frames
+
+    def read(self, out):
+        """Read frames into given buffer.
+
+        Returns:
+            int: The number of frames read, which is less than the length of
+                the buffer if not enough frames are available.
+        """
+        n = min(len(out), self.available)
+
+        i0 = self.tail % self.size
+        i1 = min(i0 + n, self.size)
+
+        out[: i1 - i0] = self.data[i0:i1]
+        out[i1 - i0 : n] = self.data[: n - (i1 - i0)]
+
+        self.tail += n
+
+        return n
+
+
+class StreamWriter(object):
+    """Stream blocks of audio to a 32 bit float WAV file from a background
+    thread.
+
+    The sound device callback only copies each block into a recycled
+    buffer and queues it, so recording length is bounded only by disk space.
+
+    Args:
+        path (str): Path of the file to write.
+        channels (int): Number of channels.
+        fps (int): Sample rate.
+    """
+
+    def __init__(self, path, channels=2, fps=44100):
+        self.path = str(path)
+        self.channels = channels
+        self.fps = fps
+
+        # The number of frames written to the file so far.
+        self.frames = 0
+
+        self._queue = queue.Queue()
+        self._free = []
+
+        self._file = open(self.path, "wb")
+        self._file.write(_wav_header(channels, fps, 0))
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, a0):
+        """Queue given block of shape (frames, channels) for writing."""
+        while self._free:
+            a1 = self._free.pop()
+            if a1.shape == a0.shape:
+                break
+        else:
+            a1 = np.empty(a0.shape, "float32")
+
+        np.copyto(a1, a0)
+        self._queue.put(a1)
+
+    def _run(self):
+        logger.info("Enter StreamWriter._run(path=%r).", self.path)
+
+        while True:
+            a0 = self._queue.get()
+
+            if a0 is None:
+                break
+
+            try:
+                self._file.write(a0.tobytes())
+                self.frames += len(a0)
+            except OSError as e:
+                logger.error(e)
+
+            self._free.append(a0)
+
+    def close(self):
+        """Write pending blocks, finalize the WAV header and close the file.
+
+        Returns:
+            ndarray: Memory-mapped array of shape (frames, channels) of the
+                recorded audio.
+        """
+        logger.info("Enter StreamWriter.close(path=%r).", self.path)
+
+        self._queue.put(None)
+        self._thread.join()
+
+        self._file.seek(0)
+        self._file.write(_wav_header(self.channels, self.fps, self.frames))
+        self._file.close()
+
+        if not self.frames:
+            return np.zeros((0, self.channels), "float32")
+
+        return np.memmap(
+            self.path,
+            dtype="float32",
+            mode="r",
+            offset=_WAV_HEADER_SIZE,
+            shape=(self.frames, self.channels),
+        )
+
+
+_WAV_HEADER_SIZE = 44
+
+
+def _wav_header(channels, fps, frames):
+    """Get the header of a 32 bit IEEE float WAV file."""
+    size = frames * channels * 4
+
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        size + _WAV_HEADER_SIZE - 8,
+        b"WAVE",
+        b"fmt ",
+        16,
+        3,
+        channels,
+        fps,
+        fps * channels * 4,
+        channels * 4,
+        32,
+        b"data",
+        size,
+    )
@@ -0,0 +1,372 @@
+import collections
+import logging
+
+import numpy as np
+
+from . import player
+from .config import FPS
+from .sound import LatencyGate, Sound, add_tracer, remove_tracer
+
+logger = logging.getLogger(__name__)
+
+#
+# Attributes that hold the running state of a sound rather than a parameter.
+#
+_STATE = {"frames", "index", "peak", "phase", "opened", "value"}
+
+_SCALARS = (int, float, str, bool, type(None))
+
+
+class RenderCache(object):
+    """An LRU cache of the rendered notes of deterministic voices.
+
+    Once set with ``player.set_render_cache()``, each note played with
+    ``GatedSound.play()`` is looked up by the class and parameters of the
+    voice, and by note, velocity and duration. On a miss the voice plays as
+    usual, and its output is recorded until it is done. On a hit the recorded
+    output is played back, sliced block by block, instead of computing the
+    forward() graph of the voice.
+
+    A voice is deterministic unless its tree contains sounds shared with
+    other voices, or sounds with a false ``deterministic`` attribute, such
+    as noise generators. Its parameters are the public attributes of the
+    sounds in its tree that hold scalars, or tuples, lists and dicts of
+    scalars, except running state, and except attributes that parent sounds
+    set on each call, such as the frequency of an oscillator. Oscillator
+    phases are therefore not preserved across cached notes.
+
+    Voices are recorded as they exit their forward() method, so while notes
+    are being recorded gated voices are computed voice by voice rather than
+    in batches.
+
+    Args:
+        budget (int): The maximum number of bytes of cached audio. The least
+            recently used notes are evicted to keep within it.
+
+    Example:
+        >>> player.set_render_cache(RenderCache(budget=64 * 2**20))
+    """
+
+    def __init__(self, budget=64 * 2**20):
+        self.budget = budget
+
+        # Mapping of key to rendered note, from least to most recently used.
+        self.entries = collections.OrderedDict()
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        # Mapping of voice to the note it is being recorded playing.
+        self._recordings = {}
+
+        # Mapping of voice to the replay of its latest cached note.
+        self._replays = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def get_key(self, voice, note, duration, velocity):
+        """Get the key of given note of given voice.
+
+        Returns:
+            tuple: The key, or None if the voice is not deterministic.
+        """
+        params = self.get_params(voice)
+
+        if params is None:
+            return None
+
+        return self._get_key(params, note, duration, velocity)
+
+    def get_params(self, voice):
+        """Get the parameters of the sounds in the tree of given voice.
+
+        Returns:
+            list: List of (sound, parameters) tuples, or None if the voice is
+                not deterministic.
+        """
+        if voice._plan is None:
+            voice.compile()
+
+        if voice._shared or not getattr(voice, "deterministic", True):
+            return None
+
+        try:
+            params = [(voice, _get_params(voice, ("freq", "velocity")))]
+
+            for s, shared in voice._plan:
+                if shared or s._shared or not getattr(s, "deterministic", True):
+                    return None
+
+                params.append((s, _get_params(s)))
+
+        # Parameters that hold other objects, such as arrays.
+        except TypeError:
+            return None
+
+        return params
+
+    def _get_key(self, params, note, duration, velocity):
+        # Attributes that parent sounds set on each call are only known once
+        # the voice renders, so they are left out here rather than when the
+        # parameters are taken.
+        params = tuple(
+            (type(s), tuple((k, v) for k, v in items if not s._routes.get(k)))
+            for s, items in params
+        )
+
+        seconds = duration * 4 * 60 / player.get_bpm()
+
+        return params, note, velocity, seconds, player.get_dtype()
+
+    def replay(self, voice, note=60, duration=1, velocity=127, t=None):
+        """Play given note of given voice from the cache, if it is there.
+
+        On a miss, the voice is recorded once the caller plays the note.
+
+        Args:
+            voice (GatedSound): The voice to play the note of.
+            note (float): Note to play in units of semitones
+                where 60 is middle C.
+            duration (float, optional): Duration to play note, in whole notes.
+            velocity (int): MIDI velocity (0-127).
+            t (float, optional): Time to start playing the note, as in
+                ``LatencyGate.open()``.
+
+        Returns:
+            bool: Whether the note is played from the cache.
+        """
+        self._collect()
+
+        # A new note of a voice cuts its previous note, as when the voice
+        # itself is reset.
+        replay = self._replays.pop(voice, None)
+
+        if replay is not None:
+            player.remove_sound(replay)
+
+        params = self.get_params(voice)
+
+        if params is None:
+            return False
+
+        key = self._get_key(params, note, duration, velocity)
+
+        a0 = self.entries.get(key)
+
+        if a0 is None:
+            self.misses += 1
+
+            # A gate that is still open would not mark the onset of the note.
+            if voice.gate.value == 0:
+                self._recordings[voice] = _Recording(params, note, duration, velocity)
+                add_tracer(self)
+
+            return False
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+
+        player.remove_sound(voice)
+
+        replay = self._replays[voice] = Replay(a0, amp=voice.amp)
+        replay.play(velocity, t)
+
+        return True
+
+    def _collect(self):
+        """Store the recorded notes of voices that are done playing."""
+        for voice, rec in list(self._recordings.items()):
+            if rec.invalid:
+                del self._recordings[voice]
+
+            elif voice.done and voice.index == rec.index:
+                del self._recordings[voice]
+                self._store(voice, rec)
+
+            elif not player.is_playing(voice):
+                del self._recordings[voice]
+
+        if not self._recordings:
+            remove_tracer(self)
+
+    def _store(self, voice, rec):
+        key = self._get_key(rec.params, *rec.note)
+
+        # Parameters changed while playing, e.g. by a knob.
+        if key != self.get_key(voice, *rec.note):
+            return
+
+        if not rec.blocks:
+            return
+
+        a0 = np.concatenate(rec.blocks)
+
+        # Keep the tail of the note, but not the silence that follows.
+        end = len(a0) - voice._silent + int(voice.get_tail() * FPS)
+
+        if end < len(a0):
+            a0 = a0[: max(0, end)].copy()
+
+        a0.flags.writeable = False
+
+        if a0.nbytes > self.budget:
+            return
+
+        self.entries[key] = a0
+        self.nbytes += a0.nbytes
+
+        while self.nbytes > self.budget:
+            _, a1 = self.entries.popitem(last=False)
+            self.nbytes -= a1.nbytes
+
+    #
+    # The cache is a sound tracer while voices are being recorded, and
+    # records their output as they exit their forward() method.
+    #
+
+    def enter(self, sound):
+        pass
+
+    def exit(self, sound):
+        rec = self._recordings.get(sound)
+
+        if rec is None or rec.invalid:
+            return
+
+        a0 = sound._a0
+
+        # The voice was reset or advanced by other means.
+        if not isinstance(a0, np.ndarray) or sound.index != rec.index:
+            rec.invalid = True
+            return
+
+        rec.index += len(a0)
+
+        if not rec.blocks:
+            g0 = sound.gate._a0
+
+            if g0 is None or not g0.any():
+                return
+
+            a0 = a0[int(g0.argmax()) :]
+
+        a0 = a0.reshape(len(a0), -1).copy()
+
+        rec.blocks.append(a0)
+        rec.nbytes += a0.nbytes
+
+        if rec.nbytes > self.budget:
+            rec.invalid = True
+            rec.blocks = []
+
+
+class _Recording(object):
+    def __init__(self, params, *note):
+        # The parameters of the voice when the note started.
+        self.params = params
+
+        # The note, duration and velocity played.
+        self.note = note
+
+        # Blocks of output from the onset of the note.
+        self.blocks = []
+        self.nbytes = 0
+
+        # The number of frames the voice has rendered.
+        self.index = 0
+
+        self.invalid = False
+
+
+def _get_params(sound, exclude=()):
+    """Get the public parameter attributes of given sound, as hashable
+    values.
+
+    Raises:
+        TypeError: If a tuple, list or dict parameter holds other objects.
+    """
+    return tuple(
+        (k, _freeze(v))
+        for k, v in sound.__dict__.items()
+        if k[0] != "_"
+        and k not in _STATE
+        and k not in exclude
+        and isinstance(v, _SCALARS + (tuple, list, dict))
+    )
+
+
+def _freeze(v):
+    """Get a hashable form of given scalar, or tuple, list or dict of them."""
+    if isinstance(v, _SCALARS):
+        return v
+
+    if isinstance(v, (tuple, list)):
+        return type(v), tuple(_freeze(v1) for v1 in v)
+
+    if isinstance(v, dict):
+        return dict, tuple(sorted((k, _freeze(v1)) for k, v1 in v.items()))
+
+    raise TypeError("Unhashable parameter of type %r." % type(v).__name__)
+
+
+class Replay(Sound):
+    """Play back a cached note, sliced block by block.
+
+    Args:
+        data (ndarray): The rendered note, from its onset, of shape
+            (frames, channels).
+        amp (float): Output amplitude - a value between 0 and 1.
+    """
+
+    def __init__(self, data, amp=0.5):
+        super().__init__(amp=amp)
+
+        self.data = data
+        self.gate = LatencyGate()
+
+        # The number of frames played back, or None before the onset.
+        self._i = None
+
+    def play(self, velocity=127, t=None):
+        """Play the note from given time, as in ``LatencyGate.open()``."""
+        self._i = None
+
+        super().play(velocity=velocity)
+        self.gate.open(t)
+
+    @property
+    def done(self):
+        return self._i is not None and self._i >= len(self.data)
+
+    def forward(self):
+        frames = self.frames
+        i0 = self._i
+
+        if i0 is None:
+            g0 = self.gate()
+            a0 = np.zeros((frames, self.data.shape[1]), self.data.dtype)
+
+            if g0.any():
+                j0 = int(g0.argmax())
+                n = min(frames - j0, len(self.data))
+
+                a0[j0 : j0 + n] = self.data[:n]
+                self._i = n
+
+            return a0
+
+        i1 = self._i = min(i0 + frames, len(self.data))
+
+        if i1 - i0 == frames:
+            return self.data[i0:i1]
+
+        a0 = np.zeros((frames, self.data.shape[1]), self.data.dtype)
+        a0[: i1 - i0] = self.data[i0:i1]
+
+        return a0
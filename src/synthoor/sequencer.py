@@ -0,0 +1,118 @@
+import heapq
+import itertools
+import logging
+
+from . import player
+
+logger = logging.getLogger(__name__)
+
+
+class Sequencer(object):
+    """A global sequencer that runs scheduled calls, such as notes, on exact
+    frames of the player sample clock.
+
+    Beat times are converted once, when scheduled, into absolute frame
+    indices and kept in a heap, so each event costs O(log n) regardless of
+    the number of queued events. The player splits its blocks at event
+    boundaries, so events run exactly on their frame.
+
+    Args:
+        bpm (float, optional): Beats per minute, defaults to the player's.
+
+    Example:
+        >>> sq = Sequencer()
+        >>> for i, note in enumerate([60, 62, 64]):
+        ...     sq.note(synth, beat=i, note=note, duration=1 / 8)
+        >>> sq.start()
+    """
+
+    def __init__(self, bpm=None):
+        self.bpm = bpm
+
+        # A heap of (frame, sequence number, function, args, kwargs) tuples,
+        # with frames counted from beat 0.
+        self.events = []
+
+        # The sample clock frame of beat 0.
+        self.frame0 = 0
+
+        self._sequence = itertools.count()
+
+    def start(self, frame=None):
+        """Start running events with beat 0 at given frame of the sample
+        clock, by default the current frame."""
+        logger.info("Enter Sequencer.start(frame=%r).", frame)
+
+        if frame is None:
+            frame = player.get_frame()
+
+        self.frame0 = frame
+        player.add_sequencer(self)
+
+        # Sequencers run as blocks are rendered, so the backend must run even
+        # before any sound plays, as when a sound is added.
+        if player.get_clock() is None:
+            player._start_backend()
+
+    def stop(self):
+        player.remove_sequencer(self)
+
+    def clear(self):
+        self.events.clear()
+
+    @property
+    def pending(self):
+        """int: The number of events not run yet."""
+        return len(self.events)
+
+    def beat2frame(self, beat):
+        """Convert beat time to a frame count from beat 0."""
+        bpm = self.bpm or player.get_bpm()
+        return player.t2frames(beat * 60 / bpm)
+
+    def at(self, beat, fn, *args, **kwargs):
+        """Schedule a call to *fn* with given arguments at given beat time."""
+        frame = self.beat2frame(beat)
+        heapq.heappush(self.events, (frame, next(self._sequence), fn, args, kwargs))
+
+    def note(self, sound, beat, note=60, duration=1, velocity=127):
+        """Schedule given gated sound to play a note at given beat time.
+
+        Args:
+            sound (GatedSound): The sound to play.
+            beat (float): Beat time to start playing the note.
+            note (float): Note to play in units of semitones
+                where 60 is middle C.
+            duration (float, optional): Duration to play note, in whole notes.
+            velocity (int): MIDI velocity (0-127).
+        """
+        self.at(beat, self._play, sound, note, duration, velocity)
+
+    @staticmethod
+    def _play(sound, note, duration, velocity):
+        # The note is timed for the first frame of the current sub-block.
+        sound.play(note, duration, velocity, t=player.get_frame_time())
+
+    def run(self, end):
+        """Run all events due at the current frame of the sample clock.
+
+        Args:
+            end (int): The frame at which the block being rendered ends.
+
+        Returns:
+            int: The frame of the next event, or *end* if it comes later.
+        """
+        frame = player.get_frame() - self.frame0
+
+        while self.events and self.events[0][0] <= frame:
+            _, _, fn, args, kwargs = heapq.heappop(self.events)
+
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                logger.error(e)
+
+        if self.events:
+            return min(end, self.events[0][0] + self.frame0)
+
+        return end
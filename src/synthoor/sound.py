@@ -1,12 +1,25 @@
+import heapq
 import inspect
+import itertools
 import logging
 import math
-import time
+import threading
 
 import numpy as np
 
-from .config import _LOG_CC, _LOG_CX, DEFAULT_AMP, FPS, LATENCY, MIDDLE_C
-from .player import add_sound, get_bpm, get_schedule, get_time, t2frames
+from .config import _LOG_CC, _LOG_CX, DEFAULT_AMP, FPS, MIDDLE_C
+from .player import (
+    add_sound,
+    get_bpm,
+    get_buffer,
+    get_dtype,
+    get_frame_time,
+    get_latency,
+    get_render_cache,
+    get_schedule,
+    get_time,
+    t2frames,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +38,83 @@ def freq2key(freq):
         return (math.log(freq) - _LOG_CX) / _LOG_CC
 
 
+def _decimate(a0, frames, indices):
+    if isinstance(a0, np.ndarray) and a0.ndim and len(a0) == frames:
+        return a0[indices]
+    return a0
+
+
+def interpolate(k0, a0, krate):
+    """Linearly interpolate control points to audio rate.
+
+    Args:
+        k0 (ndarray): The previous control point, of shape (1, ...).
+        a0 (ndarray): Array of shape (n, ...) of control points.
+        krate (int): The number of frames between control points.
+
+    Returns:
+        ndarray: Array of shape (n * krate, ...) that goes from *k0* to each
+            control point in turn, reaching it at the last frame of its
+            control period.
+    """
+    n = len(a0)
+
+    p0 = np.concatenate((k0, a0)).reshape(n + 1, -1)
+    d0 = p0[1:] - p0[:-1]
+
+    w0 = _weights.get((krate, p0.dtype))
+    if w0 is None:
+        w0 = _weights[krate, p0.dtype] = np.arange(1, krate + 1, dtype=p0.dtype) / krate
+
+    a1 = d0[:, None, :] * w0[None, :, None]
+    a1 += p0[:-1, None, :]
+
+    return a1.reshape((n * krate,) + a0.shape[1:])
+
+
+#
+# Interpolation weights by control period and data type.
+#
+_weights = {}
+
+
+#
+# Thread local state of flat plan calls in progress.
+#
+_local = threading.local()
+
+#
+# Classes of gated sounds whose forward() failed on a batch of voices, or
+# kept state of its own, and whose voices are computed one by one since.
+#
+_unbatchable = set()
+
+#
+# Attributes of a voice that differ between the voices of a batch, or that
+# the mixer sets as the voice is consumed.
+#
+_BATCH_VARS = {"freq", "velocity", "amp", "frames", "index", "peak", "_a0", "_silent"}
+
+_SCALARS = (int, float, str, bool, type(None))
+
+#
+# Tracers are notified when each sound object enters and exits its forward()
+# method, e.g. to time it. A tracer is an object with enter(sound) and
+# exit(sound) methods.
+#
+_tracers = []
+
+
+def add_tracer(tracer):
+    if tracer not in _tracers:
+        _tracers.append(tracer)
+
+
+def remove_tracer(tracer):
+    if tracer in _tracers:
+        _tracers.remove(tracer)
+
+
 class Sound(object):
     """The base class for all other sound classes, including audio samples,
     oscillators and effects.
@@ -50,12 +140,24 @@ class Sound(object):
         # The frame counter.
         self.index = 0
 
+        # If set, the sound is a control-rate modulator, see control_rate().
+        self.krate = None
+
+        # The latest control point, and interpolated frames not yet returned.
+        self._k0 = None
+        self._k1 = None
+
         self._shared = shared
 
-        # A somewhat brittle mechanism to force a note to keep "playing"
-        # for a few seconds after it's done, so a shared effect may still
-        # be applied to it (for example in the case of a long reverb).
-        self._done = 0
+        # The number of seconds a sound keeps playing after its output has
+        # become silent, e.g. so the decay of a reverb effect applied to it
+        # may still be heard.
+        self.tail = 0.0
+
+        # The peak amplitude of the latest block, and the number of frames
+        # its output has been silent for, tracked as blocks are consumed.
+        self.peak = 0.0
+        self._silent = 0
 
         # The lastest output arrays of the forward() function.
         self._a0 = None
@@ -63,6 +165,44 @@ class Sound(object):
         self._fargs = None
         self._error = None
 
+        # The flat plan of all sounds in the tree of this sound, see compile().
+        self._plan = None
+
+        # Mapping of keyword argument names of __call__() to whether they
+        # name an attribute of this sound.
+        self._routes = {}
+
+    def compile(self):
+        """Find all sounds in the tree of this sound and store them in a flat
+        plan, ordered so that children come before their parents.
+
+        Sounds shared by several parents appear in the plan once. The plan
+        is used by _rset() and _ccall() instead of walking the tree, and is
+        rebuilt each time this sound is played or reset, so sounds added to
+        the tree later are picked up then.
+        """
+        plan = []
+        index = {}
+
+        def walk(s0, shared):
+            for s in s0.__dict__.values():
+                if not isinstance(s, Sound):
+                    continue
+
+                i = index.get(id(s))
+
+                if i is None:
+                    walk(s, shared or s._shared)
+                    index[id(s)] = len(plan)
+                    plan.append([s, shared])
+                else:
+                    plan[i][1] = plan[i][1] or shared
+
+        walk(self, False)
+
+        self._plan = plan
+        self._routes = {}
+
     def _rset(self, key, value, force=False):
         """Recursively, but lazily, set property to given value on all child sounds.
 
@@ -70,19 +210,42 @@ class Sound(object):
         tree of sound objects before calling the forward() method.
         """
         if force or self.__dict__.get(key, "__NONE__") != value:
-            for s in self.__dict__.values():
-                if isinstance(s, Sound):
-                    s._rset(key, value, force=True)
+            if self._plan is not None:
+                for s, _ in self._plan:
+                    s.__dict__[key] = value
+            else:
+                for s in self.__dict__.values():
+                    if isinstance(s, Sound):
+                        s._rset(key, value, force=True)
 
         self.__dict__[key] = value
 
     def _ccall(self, name, *args, **kwargs):
         """Recursively call given function of each sound object in the tree
         of sounds.
+
+        If the sound has a flat plan, the function is called once on each
+        sound in the plan, and the nested calls these make are skipped.
         """
-        for s in self.__dict__.values():
-            if isinstance(s, Sound):
-                getattr(s, name)(*args, **kwargs)
+        if getattr(_local, "ccall", None) == name:
+            return
+
+        if self._plan is None:
+            for s in self.__dict__.values():
+                if isinstance(s, Sound):
+                    getattr(s, name)(*args, **kwargs)
+            return
+
+        _local.ccall = name
+
+        try:
+            for s, shared in self._plan:
+                if shared and "shared" in kwargs:
+                    getattr(s, name)(*args, **dict(kwargs, shared=True))
+                else:
+                    getattr(s, name)(*args, **kwargs)
+        finally:
+            _local.ccall = None
 
     def play(self, note=60, velocity=127):
         """Play given note monophonically.
@@ -100,43 +263,60 @@ class Sound(object):
     def reset(self, shared=False):
         self.index = 0
 
-        self._done = 0
+        self.peak = 0.0
+        self._silent = 0
         self._a0 = None
 
+        self._k0 = None
+        self._k1 = None
+
+        if getattr(_local, "ccall", None) != "reset":
+            self.compile()
+
         self._ccall("reset", shared=shared or self._shared)
 
     @property
     def done(self):
         # The done() function is used by the sound device to determine when
         # a playing sound may be considered done and discarded.
-        # There are various criteria and the logic is probably brittle and
-        # needs to be considered again and simplified.
-        #
-        # The general idea is to consider a sound done if after it has played
-        # for a while, it becomes nearly zero for an entire output buffer
-        # length.
         #
-        # However, in the case effects are applied to the sound, it may be
-        # needed around for a while longer even if its output has become
-        # zero. For example in the case of a reverb effect.
+        # A sound is considered done if after it has played for a while, its
+        # output has been nearly zero for an entire output buffer length, and
+        # then for the length of the longest tail in its tree, e.g. of a
+        # reverb effect. Sounds with gates that have pending events, e.g. of
+        # a note scheduled ahead, are not done.
 
         if self._error:
             return True
 
-        if self.index < FPS / 8:
+        if self.index < FPS / 8 or self._silent <= 0:
             return False
 
-        if self._a0 is None:
+        plan = self._plan or ()
+
+        if any(isinstance(s, LatencyGate) and s.states for s, _ in plan):
             return False
 
-        if not self._done:
-            if np.abs(self._a0).max() < 1e-4:
-                self._done = self.index or 1
-                self._a0 = self._a0 * 0
+        return self._silent >= self.get_tail() * FPS
 
-            return False
+    def get_tail(self):
+        """Get the longest tail of the sounds in the tree of this sound, in
+        seconds."""
+        return max([self.tail] + [s.tail for s, _ in self._plan or ()])
+
+    def track_peak(self, peak, frames):
+        """Update the tracked peak amplitude with that of the latest block.
+
+        Args:
+            peak (float): The peak amplitude of the block.
+            frames (int): The number of frames in the block.
+        """
+        self.peak = peak
 
-        return True
+        if peak < 1e-4:
+            self._silent += frames
+        else:
+            self._silent = 0
 
     #
     # This is the function called by the sound device to compute the next
@@ -148,29 +328,203 @@ class Sound(object):
 
         a0 = self(*args, **kwargs)
 
+        # Max and min do not allocate, unlike abs.
+        if isinstance(a0, np.ndarray) and a0.size:
+            self.track_peak(max(a0.max(), -a0.min()), frames)
+
         if raw:
             return a0
 
         return a0 * (self.velocity / 128 * self.amp)
 
+    def mix(self, out, frames):
+        """Consume the next *frames* and add them, scaled by velocity and
+        amplitude, to the given output buffer in place.
+
+        Args:
+            out (ndarray): The buffer to add the sound data to.
+            frames (int): Number of frames to consume.
+        """
+        a0 = self.consume(frames, raw=True)
+        a1 = get_buffer("mix", out.shape, out.dtype)
+
+        np.copyto(a1, a0)
+        np.multiply(a1, self.velocity / 128 * self.amp, out=a1)
+        np.add(out, a1, out=out)
+
+    def control_rate(self, krate=32):
+        """Compute this sound at control rate, once every *krate* frames,
+        and linearly interpolate it to audio rate.
+
+        This is meant for slow modulators such as envelopes and LFOs. The
+        forward() method then returns one frame per control period, array
+        arguments of audio rate are decimated accordingly, and the frame
+        counter counts control frames. Sound classes scale their time base
+        by *krate*. Child sounds of a control-rate sound are computed at
+        control rate too, without scaling their time base.
+
+        Interpolation lags the modulator by one control period.
+
+        Args:
+            krate (int): The number of frames in a control period, or None for
+                audio rate.
+
+        Returns:
+            Sound: This sound.
+        """
+        self.krate = krate
+        self._k0 = None
+        self._k1 = None
+
+        # Frames are set twice per block, so avoid walking the tree each time.
+        if self._plan is None:
+            self.compile()
+
+        return self
+
+    def _forward_krate(self, args, kwargs):
+        """Compute the next block at control rate and interpolate it to
+        audio rate."""
+        frames = self.frames
+        krate = self.krate
+
+        a1 = self._k1
+        left = 0 if a1 is None else len(a1)
+
+        # The number of new control points needed to fill the block.
+        n = -(-(frames - left) // krate)
+
+        if n > 0:
+            # Decimate audio rate arguments at the positions of the new
+            # control points.
+            if left + n * krate == frames:
+                ci = slice(left + krate - 1, frames, krate)
+            else:
+                ci = np.arange(left + krate - 1, left + n * krate, krate)
+                ci = ci.clip(0, frames - 1)
+
+            args = [_decimate(a, frames, ci) for a in args]
+            kwargs = {k: _decimate(a, frames, ci) for k, a in kwargs.items()}
+
+            self._rset("frames", n)
+
+            try:
+                a0 = self.forward(*args, **kwargs)
+            finally:
+                self._rset("frames", frames)
+
+            self.index += n
+
+            a0 = np.asarray(a0)
+            k0 = a0[:1] if self._k0 is None else self._k0
+            self._k0 = a0[-1:]
+
+            a0 = interpolate(k0, a0, krate)
+
+            if a1 is not None:
+                a0 = np.concatenate((a1, a0))
+        else:
+            a0 = a1
+
+        self._k1 = a0[frames:] if len(a0) > frames else None
+
+        return a0[:frames]
+
+    def _batch_key(self):
+        """Get the key used by the mixer to group voices that may be computed
+        together by consume_batch().
+        """
+        return type(self)
+
+    @classmethod
+    def consume_batch(cls, sounds, frames, out):
+        """Compute the next *frames* of a batch of voices that share the same
+        batch key and add them to the given output buffer in place.
+
+        Sound classes that can evaluate many voices as a single 2-D array
+        computation override this method. The default implementation simply
+        mixes each voice in turn.
+
+        Args:
+            sounds (list): Voices with the same batch key.
+            frames (int): Number of frames to consume from each voice.
+            out (ndarray): The buffer to add the sound data to.
+        """
+        for s in sounds:
+            s.mix(out, frames)
+
+    @staticmethod
+    def _mix_batch(sounds, a0, out):
+        """Mix the output of a batch of voices, scaled by the velocity and
+        amplitude of each voice, into the given output buffer in place.
+
+        Args:
+            sounds (list): The voices.
+            a0 (ndarray): Array of shape (frames, nvoices) with the output of
+                each voice, as computed by its forward() method.
+            out (ndarray): The buffer to add the sound data to.
+        """
+        frames = len(a0)
+
+        gain = np.array([s.velocity / 128 * s.amp for s in sounds], dtype=a0.dtype)
+        peak = np.maximum(a0.max(0), -a0.min(0)).tolist()
+
+        for i, s in enumerate(sounds):
+            s._a0 = a0[:, i : i + 1]
+            s.track_peak(peak[i], frames)
+
+        a1 = get_buffer("batch", (frames,), a0.dtype)
+        a2 = get_buffer("mix", out.shape, out.dtype)
+
+        np.matmul(a0, gain, out=a1)
+        np.copyto(a2, a1[:, None])
+        np.add(out, a2, out=out)
+
     def __call__(self, *args, **kwargs):
         assert (
             getattr(self, "frames", None) is not None
         ), "You must call super() from the sound class constructor"
 
-        for k in list(kwargs.keys()):
-            if hasattr(self, k):
-                if k == "frames":
-                    self._rset("frames", kwargs.pop("frames"))
-                else:
-                    setattr(self, k, kwargs.pop(k))
+        # Within the forward() method of a batch of gated voices, children of
+        # the first voice stand for the same children of all voices.
+        batch = getattr(_local, "batch", None)
 
-        if not self._done or self._a0 is None or len(self._a0) != self.frames:
-            try:
+        if batch is not None and id(self) in batch:
+            return _call_batch(batch, batch[id(self)], args, kwargs)
+
+        if kwargs:
+            routes = self._routes
+
+            for k in list(kwargs.keys()):
+                route = routes.get(k)
+
+                if route is None:
+                    route = routes[k] = hasattr(self, k)
+
+                if route:
+                    if k == "frames":
+                        self._rset("frames", kwargs.pop("frames"))
+                    else:
+                        setattr(self, k, kwargs.pop(k))
+
+        for tracer in _tracers:
+            tracer.enter(self)
+
+        try:
+            if self.krate:
+                self._a0 = self._forward_krate(args, kwargs)
+            else:
                 self._a0 = self.forward(*args, **kwargs)
-            except Exception as e:
-                logger.error(e)
-                self._a0 = np.zeros((self.frames, 1))
+        except Exception as e:
+            logger.error(e)
+            self._a0 = np.zeros((self.frames, 1), get_dtype())
+
+        for tracer in reversed(_tracers):
+            tracer.exit(self)
+
+        # The frame counter of control-rate sounds counts control frames.
+        if self.krate:
+            return self._a0
 
         if isinstance(self._a0, np.ndarray):
             self.index += len(self._a0)
@@ -186,7 +540,7 @@ class Sound(object):
     # The pytorch style forward function to compute the next sound buffer.
     #
     def forward(self, *args, **kwargs):
-        return np.zeros((self.frames,))
+        return np.zeros((self.frames,), get_dtype())
 
     @property
     def key(self):
@@ -212,10 +566,21 @@ class LatencyGate(Sound):
     def __init__(self):
         super().__init__()
 
+        # A heap of scheduled (time, sequence number, event) tuples.
         self.states = []
         self.opened = False
         self.value = 0
 
+        # The time of the latest scheduled event.
+        self._last = None
+
+    def reset(self, shared=False):
+        super().reset(shared)
+
+        # Discard pending events of the previous note.
+        self.states.clear()
+        self._last = None
+
     def forward(self):
         #
         # open/close events are scheduled in terms of absolute time. Here these
@@ -224,17 +589,18 @@ class LatencyGate(Sound):
 
         # states = []
 
-        a0 = np.zeros((self.frames, 1))
+        a0 = np.zeros((self.frames, 1), get_dtype())
         i0 = 0
 
-        t0 = time.time()
+        t0 = get_time()
         schedule = get_schedule()
+        latency = get_latency()
 
         while self.states:
-            t, event = self.states[0]
+            t, _, event = self.states[0]
 
             if schedule:
-                dt = max(0, t + LATENCY - schedule)
+                dt = max(0, t + latency - schedule)
             else:
                 dt = max(0, t - t0)
 
@@ -252,7 +618,7 @@ class LatencyGate(Sound):
                 self.value = 0
                 a0[i0:i1] += 1
 
-            self.states.pop(0)
+            heapq.heappop(self.states)
 
         if self.value == 1 and i0 < self.frames:
             a0[i0 : self.frames] += 1
@@ -296,20 +662,27 @@ class LatencyGate(Sound):
         if not self.states:
             last_t = tt
         else:
-            last_t = self.states[-1][0]
+            last_t = self._last
 
         if dt is not None:
             t = dt + last_t
         else:
             t = t or tt
 
-        t = max(t, tt)
+        # Events in the past play as soon as possible, but not later than
+        # events timed for the block being rendered, e.g. by a sequencer.
+        t = max(t, min(tt, get_frame_time()))
 
-        # Discard events scheduled to run after this new event.
-        while self.states and self.states[-1][0] > t:
-            self.states.pop(-1)
+        if not self.states or t > self._last:
+            self._last = t
 
-        self.states.append((t, event))
+        heapq.heappush(self.states, (t, next(_sequence), event))
+
+
+#
+# Sequence numbers keep events scheduled for the same time in order.
+#
+_sequence = itertools.count()
 
 
 class GatedSound(Sound):
@@ -326,7 +699,7 @@ class GatedSound(Sound):
         super().__init__(freq=freq, amp=amp)
         self.gate = LatencyGate()
 
-    def play(self, note=60, duration=1, velocity=127):
+    def play(self, note=60, duration=1, velocity=127, t=None):
         """Play given note monophonically.
 
         Args:
@@ -334,7 +707,162 @@ class GatedSound(Sound):
                 where 60 is middle C.
             duration (float, optional): Duration to play note, in whole notes.
             velocity (int): MIDI velocity (0-127).
+            t (float, optional): Time to start playing the note, as in
+                ``LatencyGate.open()``.
         """
+        cache = get_render_cache()
+
+        if cache is not None and cache.replay(self, note, duration, velocity, t):
+            return
+
         super().play(note=note, velocity=velocity)
-        self.gate.open()
+        self.gate.open(t)
         self.gate.close(dt=duration * 4 * 60 / get_bpm())
+
+    def _batch_key(self):
+        """Voices with the same class, tree and parameters are computed
+        together, unless they share sounds with other voices."""
+        if self._plan is None:
+            self.compile()
+
+        if (
+            self.krate
+            or self._shared
+            or type(self) in _unbatchable
+            or any(shared or s._shared for s, shared in self._plan)
+        ):
+            return type(self), id(self)
+
+        params = tuple(
+            (k, v)
+            for k, v in self.__dict__.items()
+            if k[0] != "_" and k not in _BATCH_VARS and isinstance(v, _SCALARS)
+        )
+
+        return type(self), tuple(type(s) for s, _ in self._plan), params
+
+    @classmethod
+    def consume_batch(cls, sounds, frames, out):
+        """Compute the next *frames* of a batch of voices by running the
+        forward() method of the first voice once for all of them.
+
+        While it runs, the frequency and velocity of the first voice are
+        arrays of shape (nvoices,), and each call to one of its child sounds
+        computes the same child of all voices, with signals of shape
+        (frames, nvoices). Children with a ``forward_batch()`` class method,
+        such as oscillators, envelopes and Butterworth filters, compute all
+        voices together, keeping the phase, envelope or filter state of each
+        voice. Others, such as gates, are called voice by voice.
+
+        The forward() method must therefore compute its output from its
+        children and parameters alone. A class whose forward() fails on a
+        batch, or keeps state of its own, is computed voice by voice from
+        then on. So are voices while sounds are traced, e.g. by a profiler.
+        """
+        if len(sounds) < 2 or cls in _unbatchable or _tracers:
+            return super().consume_batch(sounds, frames, out)
+
+        s0 = sounds[0]
+
+        for s in sounds:
+            s._rset("frames", frames)
+
+        batch = {
+            id(c): [s._plan[i][0] for s in sounds] for i, (c, _) in enumerate(s0._plan)
+        }
+
+        params = {k: v for k, v in s0.__dict__.items() if k not in _BATCH_VARS}
+        freq, velocity = s0.freq, s0.velocity
+
+        s0.freq = np.array([s.freq for s in sounds], dtype="float64")
+        s0.velocity = np.array([s.velocity for s in sounds])
+
+        _local.batch = batch
+
+        try:
+            a0 = s0.forward()
+
+            if not isinstance(a0, np.ndarray) or a0.shape != (frames, len(sounds)):
+                raise ValueError("Output of shape %r in batch." % (np.shape(a0),))
+
+        except Exception as e:
+            logger.error("Failed to compute batch of %s voices: %r.", cls.__name__, e)
+            _unbatchable.add(cls)
+            a0 = np.zeros((frames, len(sounds)), get_dtype())
+
+        finally:
+            _local.batch = None
+            s0.freq, s0.velocity = freq, velocity
+
+        if any(s0.__dict__.get(k) is not v for k, v in params.items()):
+            logger.warning("%s.forward() keeps state, not batching it.", cls.__name__)
+            _unbatchable.add(cls)
+
+        for s in sounds:
+            s.index += frames
+
+        cls._mix_batch(sounds, a0, out)
+
+
+def _call_batch(batch, sounds, args, kwargs):
+    """Call the same child sound of each voice of a batch, with arguments
+    of shape (nvoices,) or (frames, nvoices) split between the voices.
+
+    Returns:
+        ndarray: Array of shape (frames, nvoices).
+    """
+    n = len(sounds)
+    s0 = sounds[0]
+
+    fn = getattr(type(s0), "forward_batch", None)
+
+    if fn is not None and not s0.krate and all(type(s) is type(s0) for s in sounds):
+        routes = s0._routes
+        kw = {}
+
+        for k, v in kwargs.items():
+            route = routes.get(k)
+
+            if route is None:
+                route = hasattr(s0, k)
+
+            if not route or k == "frames":
+                kw[k] = v
+                continue
+
+            for i, s in enumerate(sounds):
+                s._routes[k] = True
+                setattr(s, k, _split(v, i, n))
+
+        a0 = fn(sounds, *args, **kw)
+
+        if a0 is not NotImplemented:
+            return a0
+
+    # Children of the voices are called as usual.
+    _local.batch = None
+
+    try:
+        al = [
+            s(
+                *[_split(a, i, n) for a in args],
+                **{k: _split(v, i, n) for k, v in kwargs.items()}
+            )
+            for i, s in enumerate(sounds)
+        ]
+    finally:
+        _local.batch = batch
+
+    return np.concatenate(al, axis=1)
+
+
+def _split(v, i, n):
+    """Get the value of voice *i* of *n* from a batch argument."""
+    if isinstance(v, np.ndarray):
+        if v.ndim == 1 and len(v) == n:
+            return v[i].item()
+
+        if v.ndim == 2 and v.shape[1] == n:
+            return v[:, i : i + 1]
+
+    return v
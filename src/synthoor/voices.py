@@ -0,0 +1,132 @@
+import itertools
+import logging
+
+import numpy as np
+
+from . import player
+
+logger = logging.getLogger(__name__)
+
+
+class VoiceManager(object):
+    """Play notes polyphonically on a pool of preallocated synth instances.
+
+    Each note is assigned to a free voice of the pool. When all voices are
+    busy, a voice is stolen, so the number of voices, and therefore the CPU
+    load, is bounded even under dense MIDI input. Voices are created, and
+    their filters warmed up, once in advance.
+
+    Args:
+        factory (callable): Function that creates a voice, e.g. a synth class.
+        voices (int): The number of voices in the pool.
+        steal (str): Which busy voice to steal for a new note - the `oldest`,
+            or the `quietest` one.
+
+    Example:
+        >>> vm = VoiceManager(TB303, voices=8)
+        >>> vm.play(note=60, duration=1 / 4)
+        >>> vm.play(note=64, duration=1 / 4)
+    """
+
+    def __init__(self, factory, voices=8, steal="oldest"):
+        assert steal in ("oldest", "quietest"), "Unknown steal policy %r." % steal
+
+        self.steal = steal
+        self.pool = [factory() for _ in range(voices)]
+
+        # Mapping of voice to the note it plays.
+        self.notes = {}
+
+        # Mapping of voice to the sequence number of its latest note.
+        self._order = {}
+        self._sequence = itertools.count()
+
+        for v in self.pool:
+            warmup(v)
+
+    def play(self, note=60, *args, **kwargs):
+        """Play given note on a free voice.
+
+        Remaining arguments are passed to the play() method of the voice.
+
+        Returns:
+            Sound: The voice playing the note.
+        """
+        voice = self.allocate()
+
+        self.prune()
+
+        self.notes[voice] = note
+        self._order[voice] = next(self._sequence)
+
+        voice.play(note, *args, **kwargs)
+
+        return voice
+
+    def allocate(self):
+        """Get a free voice, or steal one if all voices are busy."""
+        busy = []
+
+        for v in self.pool:
+            if player.is_playing(v) and not v.done:
+                busy.append(v)
+            else:
+                return v
+
+        if self.steal == "quietest":
+            voice = min(busy, key=get_peak)
+        else:
+            voice = min(busy, key=lambda v: self._order.get(v, -1))
+
+        logger.debug("Steal voice playing note %r.", self.notes.get(voice))
+
+        player.remove_sound(voice)
+
+        return voice
+
+    def release(self, note, t=None):
+        """Close the gate of voices playing given note."""
+        self.prune()
+
+        for v, n in self.notes.items():
+            if n == note and hasattr(v, "gate"):
+                v.gate.close(t)
+
+    def prune(self):
+        """Forget the notes of voices that are done playing."""
+        for v in [v for v in self.notes if v.done]:
+            del self.notes[v]
+            del self._order[v]
+
+    def stop(self):
+        """Stop all voices."""
+        for v in self.pool:
+            player.remove_sound(v)
+
+        self.notes.clear()
+        self._order.clear()
+
+    @property
+    def playing(self):
+        """int: The number of busy voices."""
+        return sum(1 for v in self.pool if player.is_playing(v))
+
+
+def warmup(sound):
+    """Call the warmup() method of each sound in the tree of given sound that
+    has one, e.g. to compute filter coefficient tables in advance."""
+    sound.compile()
+
+    for s in [sound] + [s for s, _ in sound._plan]:
+        fn = getattr(s, "warmup", None)
+        if callable(fn):
+            fn()
+
+
+def get_peak(sound):
+    """Get the peak amplitude of the latest output of given sound."""
+    # A voice that has not rendered yet has just started.
+    if sound._a0 is None:
+        return np.inf
+
+    return sound.peak * sound.velocity / 128 * sound.amp
@@ -0,0 +1,212 @@
+import logging
+import math
+
+import numpy as np
+
+from .cache import load_arrays, save_arrays
+from .player import get_buffer
+
+logger = logging.getLogger(__name__)
+
+
+class WavetableBank(object):
+    """Band-limited sawtooth and square wave cycles for any number of
+    harmonics, read from a single compact table.
+
+    Row k of the table holds one cycle of the partial sum of sin(j x) / j
+    for j = 1..k. A sawtooth wave with k harmonics is this sum shifted by
+    half a cycle, and a square wave of any duty is the difference of two
+    shifted copies of it, so one table of shape (nharmonics + 1, size)
+    serves every waveform, harmonic count and duty.
+
+    Args:
+        size (int): The number of samples in a cycle.
+        nharmonics (int): The maximum number of harmonics.
+        dtype (str): Data type of the table.
+        shared (bool): Memory-map the table from the on-disk cache, so it is
+            shared by all processes using it.
+    """
+
+    def __init__(self, size=1024, nharmonics=128, dtype="float32", shared=False):
+        self.size = size
+        self.nharmonics = nharmonics
+
+        key = (size, nharmonics, dtype)
+
+        arrays = load_arrays("wavetable", key) if shared else None
+
+        if arrays is not None:
+            table = arrays["table"]
+        else:
+            table = self.build(size, nharmonics).astype(dtype)
+
+            if shared:
+                save_arrays("wavetable", key, dict(table=table))
+
+        self.table = table
+
+    @staticmethod
+    def build(size, nharmonics):
+        """Compute the table of partial sums in a single vectorized pass."""
+        logger.info(
+            "Enter WavetableBank.build(size=%r, nharmonics=%r).", size, nharmonics
+        )
+
+        k = np.arange(1, nharmonics + 1)[:, None]
+        radians = 2 * math.pi / size * np.arange(size)[None, :]
+
+        table = np.zeros((nharmonics + 1, size))
+        np.cumsum(np.sin(k * radians) / k, axis=0, out=table[1:])
+
+        return table
+
+    def read(self, nharmonics, indices, out=None):
+        """Read partial sums at given cycle indices.
+
+        A fractional number of harmonics linearly crossfades between the
+        two adjacent rows, e.g. 3.25 is the sum of 3 harmonics plus a quarter
+        of the fourth.
+
+        Args:
+            nharmonics (int, float or ndarray): The number of harmonics, either
+                a single number or an array that broadcasts with *indices*.
+            indices (ndarray): Integer indices into a cycle of *size* samples.
+            out (ndarray, optional): Buffer of the table data type to read
+                into. Only used with a single integer number of harmonics.
+
+        Returns:
+            ndarray
+        """
+        if isinstance(nharmonics, (int, np.integer)):
+            return np.take(self.table[nharmonics], indices, out=out, mode="wrap")
+
+        if not np.issubdtype(np.asarray(nharmonics).dtype, np.floating):
+            return self.table[nharmonics, indices]
+
+        k = np.minimum(np.floor(nharmonics), self.nharmonics - 1).astype("int64")
+        w = np.subtract(nharmonics, k, dtype="float32")
+
+        a0 = self.table[k, indices]
+        a1 = self.table[k + 1, indices]
+
+        return a0 + w * (a1 - a0)
+
+    def sawtooth(self, indices, nharmonics, dtype="float64", out=None):
+        """Get sawtooth wave samples at given cycle indices.
+
+        Args:
+            indices (ndarray): Integer indices into a cycle of *size* samples.
+            nharmonics (int, float or ndarray): The number of harmonics, as
+                in read().
+            dtype (str): Data type of the samples.
+            out (ndarray, optional): Buffer to write the samples to.
+
+        Returns:
+            ndarray
+        """
+        if out is None:
+            i0 = (indices + self.size // 2) % self.size
+            return np.multiply(self.read(nharmonics, i0), -2 / math.pi, dtype=dtype)
+
+        i0 = get_buffer("wavetable.i0", indices.shape, indices.dtype)
+        a0 = get_buffer("wavetable.a0", indices.shape, self.table.dtype)
+
+        np.add(indices, self.size // 2, out=i0)
+        np.remainder(i0, self.size, out=i0)
+
+        # Copy first, since casting ufuncs allocate internal buffers.
+        np.copyto(out, self.read(nharmonics, i0, a0))
+        out *= -2 / math.pi
+
+        return out
+
+    def square(self, indices, nharmonics, duty=0.5, dtype="float64", out=None):
+        """Get square wave samples at given cycle indices.
+
+        Args:
+            indices (ndarray): Integer indices into a cycle of *size* samples.
+            nharmonics (int, float or ndarray): The number of harmonics, as
+                in read().
+            duty (float or ndarray): The duty cycle between 0 and 1, either a
+                single number or an array that broadcasts with *indices*.
+            dtype (str): Data type of the samples.
+            out (ndarray, optional): Buffer to write the samples to, for
+                a single duty cycle.
+
+        Returns:
+            ndarray
+        """
+        if out is not None and np.ndim(duty) == 0:
+            return self._square(indices, nharmonics, duty, out)
+
+        shift = np.rint(np.multiply(duty, self.size / 2)).astype("int64")
+
+        i0 = (indices + shift) % self.size
+        i1 = (indices - shift) % self.size
+
+        a0 = np.subtract(
+            self.read(nharmonics, i0), self.read(nharmonics, i1), dtype=dtype
+        )
+
+        a0 *= 2 / math.pi
+        a0 += np.subtract(np.multiply(duty, 2, dtype=dtype), 1, dtype=dtype)
+
+        if out is not None:
+            np.copyto(out, a0)
+            return out
+
+        return a0
+
+    def _square(self, indices, nharmonics, duty, out):
+        """Compute square wave of a single duty cycle into given buffer,
+        using preallocated scratch buffers."""
+        shift = int(round(duty * self.size / 2))
+
+        i0 = get_buffer("wavetable.i0", indices.shape, indices.dtype)
+        i1 = get_buffer("wavetable.i1", indices.shape, indices.dtype)
+        a0 = get_buffer("wavetable.a0", indices.shape, self.table.dtype)
+        a1 = get_buffer("wavetable.a1", indices.shape, self.table.dtype)
+
+        np.add(indices, shift, out=i0)
+        np.remainder(i0, self.size, out=i0)
+        np.subtract(indices, shift, out=i1)
+        np.remainder(i1, self.size, out=i1)
+
+        a0 = self.read(nharmonics, i0, a0)
+        a1 = self.read(nharmonics, i1, a1)
+
+        # Copy first, since casting ufuncs allocate internal buffers.
+        if a1.dtype != out.dtype:
+            a2 = get_buffer("wavetable.a2", indices.shape, out.dtype)
+            np.copyto(a2, a1)
+            a1 = a2
+
+        np.copyto(out, a0)
+        out -= a1
+        out *= 2 / math.pi
+        out += duty * 2 - 1
+
+        return out
+
+
+_banks = {}
+_shared = False
+
+
+def share_wavetables(shared=True):
+    """Memory-map wavetables from the on-disk cache so they are shared across
+    processes. Only affects banks created afterwards."""
+    global _shared
+    _shared = shared
+
+
+def get_wavetable_bank(size=1024, nharmonics=128):
+    """Get the wavetable bank for given cycle size, creating it on first use."""
+    key = (size, nharmonics)
+
+    bank = _banks.get(key)
+
+    if bank is None:
+        bank = _banks[key] = WavetableBank(size, nharmonics, shared=_shared)
+
+    return bank
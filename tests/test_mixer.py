@@ -0,0 +1,171 @@
+import time
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from synthoor import ButterFilter, Envelope, Oscillator, Sound, player
+from synthoor.sound import GatedSound
+
+
+FRAMES = 1024
+
+
+@pytest.fixture
+def clock():
+    """Render on the virtual clock, without an audio backend."""
+    player.stop_sound()
+    player.set_clock(0.0)
+
+    yield
+
+    player.stop_sound()
+    player.set_clock(None)
+
+
+def test_render_allocates_no_arrays_in_steady_state(clock):
+    for i in range(32):
+        Oscillator("saw", freq=100 + 10 * i).play()
+
+    out = np.zeros((FRAMES, 2))
+
+    # Let sounds and the mixer allocate their buffers.
+    for _ in range(8):
+        player._render(out, FRAMES)
+
+    tracemalloc.start()
+
+    try:
+        m0 = tracemalloc.get_traced_memory()[0]
+
+        for _ in range(32):
+            m1 = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+            player._render(out, FRAMES)
+
+            # Small Python objects, such as floats, are allocated per voice,
+            # but no array of even a single channel of the block.
+            assert tracemalloc.get_traced_memory()[1] - m1 < FRAMES * 8
+
+        assert tracemalloc.get_traced_memory()[0] - m0 < FRAMES * 8
+
+    finally:
+        tracemalloc.stop()
+
+    assert np.abs(out).max() > 0
+
+
+def test_max_voices_keeps_newest(clock):
+    sounds = [Oscillator("sine", freq=100 * i) for i in range(1, 5)]
+
+    player.set_max_voices(2)
+
+    try:
+        for s in sounds:
+            s.play()
+
+        assert set(player._get_sounds()) == set(sounds[2:])
+
+        sounds[0].play()
+
+        assert set(player._get_sounds()) == {sounds[0], sounds[3]}
+
+    finally:
+        player.set_max_voices(None)
+
+
+class Stall(Sound):
+    """A constant sound that stalls rendering its second block."""
+
+    def __init__(self):
+        super().__init__()
+
+        self.velocity = 128
+        self.amp = 1.0
+
+    def forward(self):
+        if self.index == 512:
+            time.sleep(0.05)
+
+        return np.ones((self.frames, 1))
+
+
+@pytest.fixture
+def pool():
+    player.set_mixer_threads(2, deadline=0.5)
+
+    yield
+
+    player.set_mixer_threads(0)
+
+
+def test_late_voice_plays_behind_without_overlap(pool):
+    sound = Stall()
+    levels = []
+
+    # Blocks are split at sequencer events too.
+    for frames in (512, 512, 512, 100, 412, 512, 512):
+        out = np.zeros((frames, 2))
+        player._mix_sounds_parallel([[sound]], frames, out)
+        levels.append((out.min(), out.max()))
+
+        time.sleep(0.06)
+
+    assert levels[1] == (0, 0)
+    assert all(lv == (1, 1) for lv in levels[:1] + levels[2:])
+
+
+class Pluck(GatedSound):
+    """A saw through a lowpass filter that follows a decaying envelope."""
+
+    def __init__(self, sweep):
+        super().__init__()
+
+        self.sweep = sweep
+
+        self.osc0 = Oscillator("saw")
+        self.env0 = Envelope(0.0, 0.5, 0.0, 0.0)
+        self.filter = ButterFilter()
+
+    def forward(self):
+        g0 = self.gate()
+        e0 = self.env0(g0) * self.sweep
+        a0 = self.osc0(freq=self.freq)
+        return self.filter(a0, key_modulation=e0, freq=self.freq * 4)
+
+
+def render_plucks(sweep, batching):
+    player.set_batching(batching)
+
+    for note in range(48, 72, 3):
+        Pluck(sweep).play(note)
+
+    out = np.zeros((512, 2))
+    blocks = []
+
+    for _ in range(64):
+        player._render(out, 512)
+        blocks.append(out[:, 0].copy())
+
+    player.stop_sound()
+
+    return np.concatenate(blocks)
+
+
+@pytest.mark.parametrize("sweep,tolerance", [(0, 1e-6), (12, 0.05)])
+def test_batched_filters_match_voice_by_voice(clock, sweep, tolerance):
+    Pluck(0).filter.warmup()
+    batching = player.get_batching()
+
+    try:
+        a0 = render_plucks(sweep, False)
+        a1 = render_plucks(sweep, True)
+    finally:
+        player.set_batching(batching)
+
+    # Batched filters carry their state across small changes of the cutoff,
+    # rather than crossfade between coefficients every block.
+    error = np.sqrt(np.mean((a1 - a0) ** 2) / np.mean(a0**2))
+
+    assert error < tolerance
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from synthoor import Envelope, OfflineRenderer, Oscillator, player
+from synthoor.config import FPS
+from synthoor.envelope import gate2events, gates2events
+from synthoor.sound import GatedSound
+
+
+class Synth(GatedSound):
+    def __init__(self):
+        super().__init__()
+
+        self.osc0 = Oscillator("sine")
+        self.env0 = Envelope(0.0, 0.0, 1.0, 0.0)
+
+    def forward(self):
+        g0 = self.gate()
+        return self.osc0(freq=self.freq) * self.env0(g0)
+
+
+@pytest.fixture
+def renderer():
+    with OfflineRenderer(frames=512) as r:
+        yield r
+
+    player.stop_sound()
+
+
+def test_play_scheduled_ahead(renderer):
+    synth = Synth()
+    synth.play(duration=1 / 16, t=renderer.time + 0.5)
+
+    a0 = renderer.render(1)
+
+    assert np.abs(a0[: int(0.49 * FPS)]).max() == 0
+    assert np.abs(a0[int(0.5 * FPS) :]).max() > 0.1
+
+
+def test_done_after_longest_tail_in_tree(renderer):
+    synth = Synth()
+    synth.env0.tail = 0.5
+    synth.play(duration=1 / 16)
+
+    renderer.render(0.5)
+    assert player.is_playing(synth)
+
+    renderer.render(0.5)
+    assert not player.is_playing(synth)
+
+
+def test_gate_events_of_empty_block():
+    gates = np.zeros((0, 2))
+
+    states, v0 = gates2events(gates, [0, 1], [10, 20])
+
+    assert states == [gate2events(gates[:, 0], 0, 10)[0], [(20, "continue")]]
+    assert v0 == [0, 1]